@@ -0,0 +1,503 @@
+"""
+Benchmark the pipeline offline: Reddit, the browser captures, Google TTS and the YouTube upload are swapped for local
+fakes, so a run only measures our own code (and ffmpeg). Each scenario is one synthetic post with a given number of
+comments of a given length. The script reports wall time, CPU time and peak RSS per stage, and appends the results to
+benchmark_results.jsonl so runs of different versions can be compared.
+
+    python benchmark.py --comments 3,8,16 --lengths short,long
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # not on Windows, peak RSS and child CPU are left out there
+except ImportError:
+    resource = None
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+default_results_path = os.path.join(repo_dir, "benchmark_results.jsonl")
+comment_lengths = {"short": (5, 20), "medium": (30, 60), "long": (90, 150)}  # words per comment
+_words = ("the a my when you they never always people think because really thing first time work friend "
+          "school money house dog cat movie game night year life family food car phone job reddit").split()
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    """Reset this process's VmHWM so the next reading only covers what runs from now on. Linux only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    """
+    This process's resident memory high water mark: since the last _reset_peak_rss on Linux, otherwise since the
+    process started (each scenario runs in its own process). None where we can't tell.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _children_peak_rss_mb():
+    """The largest resident memory of any child (ffmpeg) so far in this scenario's process."""
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+
+class StageTimer:
+    """
+    Accumulates wall time, CPU time (ours and ffmpeg's) and peak RSS for named, possibly nested, stages.
+    Where the high water mark can be reset, each stage's peak only covers that stage (and the stages inside it).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._stack = []  # [name, peak so far] of the open stages
+        self._resettable = _reset_peak_rss()
+
+    def _fold_peak(self):
+        """Carry the peak since the last reset into every open stage."""
+        peak = _peak_rss_mb()
+        if peak is not None:
+            for open_stage in self._stack:
+                open_stage[1] = max(open_stage[1] or 0.0, peak)
+
+    @contextmanager
+    def stage(self, name):
+        if self._resettable:
+            self._fold_peak()
+            _reset_peak_rss()
+        self._stack.append([name, None])
+        full_name = "/".join(open_stage[0] for open_stage in self._stack)
+        wall, cpu, children_cpu = time.perf_counter(), time.process_time(), _children_cpu()
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            _, peak = self._stack.pop()
+            entry = self.stages.setdefault(full_name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                                       "children_cpu_s": 0.0, "peak_rss_mb": None})
+            entry["calls"] += 1
+            entry["wall_s"] += time.perf_counter() - wall
+            entry["cpu_s"] += time.process_time() - cpu
+            entry["children_cpu_s"] += _children_cpu() - children_cpu
+            if peak is not None:
+                entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0.0, peak)
+            entry["children_peak_rss_mb"] = _children_peak_rss_mb()
+
+    def wrap(self, owner, attribute, name):
+        """
+        Time every call to owner.attribute (a module function or a method) as a stage.
+        Only for functions called from the benchmark's thread.
+        """
+        func = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        setattr(owner, attribute, timed)
+
+
+# ---- stand ins for asyncpraw ----
+
+class FakeAuthor:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeComment:
+    def __init__(self, comment_id, link_id, body, score):
+        self.id = comment_id
+        self.link_id = link_id
+        self.body = body
+        self.score = score
+        self.author = FakeAuthor(f"user_{comment_id}")
+
+
+class FakeCommentForest:
+    def __init__(self, comments):
+        self._comments = comments
+
+    async def replace_more(self, limit=0):
+        pass
+
+
+class FakeSubmission:
+    def __init__(self, post_id, title, comments):
+        self.id = post_id
+        self.title = title
+        self.over_18 = False
+        self.score = 1000
+        self.author = FakeAuthor(f"op_{post_id}")
+        self.comments = FakeCommentForest(comments)
+
+
+class FakeSubreddit:
+    def __init__(self, reddit):
+        self.reddit = reddit
+
+    async def top(self, time_filter="day"):
+        for post_id in self.reddit.listed:
+            yield self.reddit.submissions[post_id]
+
+    async def search(self, query, limit=None, sort="top"):
+        for post_id in self.reddit.listed:
+            submission = self.reddit.submissions[post_id]
+            if query.lower() in submission.title.lower():
+                yield submission
+
+
+class FakeReddit:
+    """The parts of asyncpraw.Reddit that reddit_lib uses, serving synthetic posts from memory."""
+
+    def __init__(self):
+        self.submissions = {}
+        self.comment_texts = {}
+        self.listed = []  # the post IDs top and search return
+
+    def add_post(self, post_id, title, comment_bodies):
+        comments = [FakeComment(f"{post_id}c{index}", f"t3_{post_id}", body, 500 - index)
+                    for index, body in enumerate(comment_bodies)]
+        self.submissions[post_id] = FakeSubmission(post_id, title, comments)
+        for comment in comments:
+            self.comment_texts[comment.id] = comment.body
+
+    async def subreddit(self, name):
+        return FakeSubreddit(self)
+
+    async def submission(self, post_id):
+        return self.submissions[post_id]
+
+    async def info(self, fullnames):
+        async def listing():
+            for fullname in fullnames:
+                post_id = fullname[3:]
+                if post_id in self.submissions:
+                    yield self.submissions[post_id]
+
+        return listing()
+
+
+# ---- stand ins for the browser captures, TTS and upload ----
+
+def _encode_png(bgr):
+    import cv2
+    return cv2.imencode(".png", bgr)[1].tobytes()
+
+
+def install_fake_capture(reddit_lib, fake_reddit, latency):
+    """Replace the Selenium captures with cards drawn from the fake posts, after latency seconds each."""
+    import card_renderer
+
+    def capture_post(post_id, image_path=None, nsfw=False, driver=None):
+        time.sleep(latency)
+        submission = fake_reddit.submissions[post_id]
+        meta_post = reddit_lib.MetaPost(text=submission.title, post_id=post_id, nsfw=False, score=submission.score)
+        png = _encode_png(card_renderer.render_post_card(meta_post, None, "AskReddit"))
+        reddit_lib._save_image(image_path, png)
+        return png
+
+    def comment_png(post_id, comment_id):
+        meta_comment = reddit_lib.MetaComment(text=fake_reddit.comment_texts[comment_id], post_id=post_id,
+                                              comment_id=comment_id)
+        return _encode_png(card_renderer.render_comment_card(meta_comment, None))
+
+    def capture_comment(post_id, comment_id, image_path, subreddit, retry=False, driver=None):
+        time.sleep(latency)
+        png = comment_png(post_id, comment_id)
+        reddit_lib._save_image(image_path, png)
+        return png
+
+    def capture_comments(post_id, comment_ids, subreddit, driver=None):
+        time.sleep(latency)  # one page load for the whole thread
+        return {comment_id: comment_png(post_id, comment_id) for comment_id in comment_ids}
+
+    reddit_lib.capture_reddit_mobile_post_card = capture_post
+    reddit_lib.capture_reddit_comment_mobile = capture_comment
+    reddit_lib.capture_reddit_comments_mobile = capture_comments
+
+
+def make_fake_tts_engine(tts_lib, speaking_rate, latency):
+    """The local tone engine, slowed down by latency seconds per request like a round trip to Google would."""
+
+    class FakeTTSEngine(tts_lib.LocalTTSEngine):
+        name = "benchmark"
+
+        def synthesize(self, text):
+            time.sleep(latency)
+            return super().synthesize(text)
+
+    return FakeTTSEngine(speaking_rate=speaking_rate)
+
+
+def install_fake_upload(youtube_lib, latency):
+    uploads = []
+
+    def upload(video_path, title, unlisted=True):
+        time.sleep(latency)
+        with open(video_path, "rb") as f:
+            uploads.append((title, len(f.read())))
+        return f"https://www.youtube.com/watch?v=benchmark{len(uploads)}"
+
+    youtube_lib.upload_to_askreddit_channel = upload
+    return uploads
+
+
+# ---- scenarios ----
+
+def synthetic_text(rng, words):
+    return " ".join(rng.choice(_words) for _ in range(words)).capitalize() + "."
+
+
+def make_scenarios(comment_counts, lengths, seed):
+    rng = random.Random(seed)
+    scenarios = []
+    for length in lengths:
+        low, high = comment_lengths[length]
+        for count in comment_counts:
+            post_id = f"bench{count}{length[0]}{rng.randrange(10 ** 6)}"
+            title = f"What is the {synthetic_text(rng, 8)[:-1].lower()}?"
+            bodies = [synthetic_text(rng, rng.randint(low, high)) for _ in range(count)]
+            scenarios.append({"name": f"{count}x{length}", "post_id": post_id, "title": title, "comments": bodies})
+    return scenarios
+
+
+def make_assets(work_dir, music_seconds):
+    """A background, a sine wave music track long enough for every scenario, and the output directories."""
+    import cv2
+    import numpy as np
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    for directory in ("audio", "images", "videos", "music"):
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+    gradient = np.linspace(40, 200, 1920, dtype=np.uint8)[:, None, None]
+    cv2.imwrite(os.path.join(work_dir, "background.png"), np.broadcast_to(gradient, (1920, 1080, 3)).copy())
+    subprocess.run([get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"sine=frequency=220:duration={music_seconds:.0f}", "-ac", "2", "-ar", "44100",
+                    os.path.join(work_dir, "music", "benchmark.mp3")], check=True)
+
+
+def clear_tts_cache(video_creator):
+    """So every run synthesizes its clips instead of timing cache hits from the run before."""
+    shutil.rmtree(video_creator.tts_cache.directory, ignore_errors=True)
+    os.makedirs(video_creator.tts_cache.directory)
+
+
+def git_version():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _comparison_key(record):
+    """Runs are only compared with runs of the same scenario under the same settings."""
+    return record["scenario"], json.dumps(record["settings"], sort_keys=True)
+
+
+def load_previous(results_path):
+    """The latest stored result for each scenario and settings."""
+    previous = {}
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[_comparison_key(record)] = record
+    return previous
+
+
+def print_report(record, previous):
+    print(f"\nScenario {record['scenario']} ({record['version']})")
+    print(f"  {'stage':<40}{'wall s':>9}{'cpu s':>9}{'ffmpeg s':>10}{'peak MB':>9}{'ffmpeg MB':>11}"
+          f"{'vs last':>9}")
+    last_stages = previous["stages"] if previous is not None else {}
+    for name, stage in record["stages"].items():
+        change = ""
+        if name in last_stages and last_stages[name]["wall_s"] > 0:
+            change = f"{(stage['wall_s'] / last_stages[name]['wall_s'] - 1) * 100:+.0f}%"
+        peak = f"{stage['peak_rss_mb']:.0f}" if stage["peak_rss_mb"] is not None else "-"
+        children_peak = f"{stage['children_peak_rss_mb']:.0f}" if stage["children_peak_rss_mb"] else "-"
+        print(f"  {name:<40}{stage['wall_s']:>9.2f}{stage['cpu_s']:>9.2f}{stage['children_cpu_s']:>10.2f}"
+              f"{peak:>9}{children_peak:>11}{change:>9}")
+
+
+def _settings(args):
+    return {"capture": args.capture, "render_mode": args.render_mode, "capture_latency": args.capture_latency,
+            "tts_latency": args.tts_latency, "upload_latency": args.upload_latency}
+
+
+def _scenarios(args):
+    return make_scenarios([int(count) for count in args.comments.split(",")], args.lengths.split(","), args.seed)
+
+
+def run_scenario(args, scenario):
+    """Run one scenario in this process and return its stages. Called in a fresh process per scenario."""
+    work_dir = tempfile.mkdtemp(prefix="reddyt_benchmark_")
+    # the modules read their settings and make their caches relative to the working directory when imported
+    os.chdir(work_dir)
+    for name in ("reddit_client_id", "reddit_client_secret", "reddit_username", "reddit_password"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ["dry_run"] = "True"
+    os.environ["tts_backend"] = "local"
+    os.environ["capture_backend"] = "render" if args.capture == "render" else "selenium"
+    os.environ["render_mode"] = args.render_mode
+    sys.path.insert(0, repo_dir)
+
+    import reddit_lib
+    import dedup_lib
+    import tts_lib
+    import video_creator
+    import youtube_lib
+    import music_lib
+    import metrics_lib
+    from moviepy.video.VideoClip import VideoClip
+
+    fake_reddit = FakeReddit()
+    fake_reddit.add_post(scenario["post_id"], scenario["title"], scenario["comments"])
+    fake_reddit.listed = [scenario["post_id"]]
+    reddit_lib.reddit = fake_reddit
+    install_fake_capture(reddit_lib, fake_reddit, args.capture_latency)
+    video_creator.tts_engine = make_fake_tts_engine(tts_lib, video_creator.tts_speaking_rate, args.tts_latency)
+    install_fake_upload(youtube_lib, args.upload_latency)
+
+    # enough music for the voiceover, after the part of each track we never use
+    voiceover = sum(video_creator.tts_engine.duration_ms(text) / 1000 + 0.7
+                    for text in [scenario["title"]] + scenario["comments"])
+    make_assets(work_dir, music_lib.min_start_time + voiceover + 30)
+    music_lib.load_index(os.path.join(work_dir, "music"))
+
+    timer = StageTimer()
+    for owner, attribute, name in [
+        (video_creator, "make_mp3s", "tts"),
+        (video_creator, "assemble_voiceover", "voiceover"),
+        (video_creator, "composite_images", "composite"),
+        (video_creator, "add_music_to_audio", "music"),
+        (video_creator, "write_still_video", "encode"),
+        (video_creator, "write_segmented_video", "encode"),
+        (VideoClip, "write_videofile", "encode"),  # the moviepy render mode
+        (video_creator, "post_video", "upload"),
+    ]:
+        timer.wrap(owner, attribute, name)
+
+    try:
+        for _ in range(args.repeat):
+            # an earlier repeat mustn't have marked the post as produced
+            reddit_lib.produced_posts = video_creator.produced_posts = dedup_lib.DedupIndex()
+            with timer.stage("get_n_posts_with_m_comments"):
+                post_with_comments, = reddit_lib.get_n_posts_with_m_comments("AskReddit", 1,
+                                                                             len(scenario["comments"]))
+            with timer.stage("get_images_for_post_with_comments"):
+                reddit_lib.get_images_for_post_with_comments(post_with_comments)
+            clear_tts_cache(video_creator)
+            with timer.stage("make_video_from_post_with_comments"):
+                video_creator.make_video_from_post_with_comments(post_with_comments)
+            clear_tts_cache(video_creator)
+            with timer.stage("make_and_post_video"):
+                video_creator.make_and_post_video(post_with_comments)
+    finally:
+        # write the metrics and traces into the working directory now, and not again at exit once it's gone
+        metrics_lib.flush()
+        metrics_lib.metrics_path = metrics_lib.trace_path = ""
+        os.chdir(repo_dir)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"Kept the working directory {work_dir}")
+    return timer.stages
+
+
+def run(args):
+    """Run every scenario in its own process, so memory peaks don't carry over from one scenario to the next."""
+    results_path = os.path.abspath(args.results)
+    previous = load_previous(results_path)
+    version = git_version()
+    for scenario in _scenarios(args):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stages_path = os.path.join(tmp_dir, "stages.json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                            "--only", scenario["name"], "--stages-to", stages_path], check=True)
+            with open(stages_path) as f:
+                stages = json.load(f)
+        record = {
+            "version": version,
+            "label": args.label,
+            "timestamp": time.time(),
+            "platform": platform.platform(),
+            "scenario": scenario["name"],
+            "repeat": args.repeat,
+            "settings": _settings(args),
+            "stages": stages,
+        }
+        print_report(record, previous.get(_comparison_key(record)))
+        with open(results_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    print(f"\nResults appended to {results_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video pipeline with offline fakes.")
+    parser.add_argument("--comments", default="3,8,16", help="comma separated comment counts, at most 17")
+    parser.add_argument("--lengths", default="short,long", help=f"comma separated, from {', '.join(comment_lengths)}")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario, times are summed")
+    parser.add_argument("--capture", choices=["fake", "render"], default="fake",
+                        help="fake: stand in for the Selenium captures, render: the card_renderer backend")
+    parser.add_argument("--render-mode", default=os.environ.get("render_mode", "still"),
+                        choices=["still", "segments", "moviepy"])
+    parser.add_argument("--capture-latency", type=float, default=0.0, help="seconds per fake page load")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="seconds per fake TTS request")
+    parser.add_argument("--upload-latency", type=float, default=0.0, help="seconds per fake upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="free text stored with the results, e.g. what changed")
+    parser.add_argument("--results", default=default_results_path)
+    parser.add_argument("--keep", action="store_true", help="keep the working directory with the videos")
+    # used by run to start the process for one scenario
+    parser.add_argument("--only", help=argparse.SUPPRESS)
+    parser.add_argument("--stages-to", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.only is None:
+        run(args)
+        return
+    scenario, = [scenario for scenario in _scenarios(args) if scenario["name"] == args.only]
+    stages = run_scenario(args, scenario)
+    with open(args.stages_to, "w") as f:
+        json.dump(stages, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import metrics_lib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+
+class DiskCache:
+    """
+    A directory of files named by a hash of whatever produced them, e.g. screenshots or TTS audio.
+    Entries expire after ttl seconds, and the least recently used entries are evicted once the directory grows
+    past max_bytes, down to 90% of it so a full cache isn't scanned again on the very next put. Entry age comes from
+    the file's mtime and recency from its atime, which is set on every hit.
+    The size of the directory is scanned once and then kept as a running total, so a put only scans the directory
+    again when the total goes over max_bytes, or every sweep_every puts to clear out expired entries.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=None, suffix="", name=None, sweep_every=100):
+        self.directory = directory
+        self.name = name or os.path.basename(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+        self.sweep_every = sweep_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._puts_since_evict = 0
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash any json serializable inputs into a key."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _is_expired(self, stat, now):
+        return self.ttl is not None and now - stat.st_mtime > self.ttl
+
+    def get(self, key) -> Optional[str]:
+        """Return the path of a fresh entry for key, or None on a miss."""
+        path = self.path_for(key)
+        now = time.time()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or self._is_expired(stat, now):
+            with self._lock:
+                self.misses += 1
+            metrics_lib.increment("cache_misses_total", cache=self.name)
+            return None
+        # mark as recently used, keep the mtime so the ttl still counts from when it was written
+        os.utime(path, (now, stat.st_mtime))
+        with self._lock:
+            self.hits += 1
+        metrics_lib.increment("cache_hits_total", cache=self.name)
+        return path
+
+    def contains(self, key) -> bool:
+        """Whether there is a fresh entry for key. Unlike get, this isn't counted as a hit or miss or as a use."""
+        try:
+            stat = os.stat(self.path_for(key))
+        except FileNotFoundError:
+            return False
+        return not self._is_expired(stat, time.time())
+
+    def copy_to(self, key, destination) -> bool:
+        """Copy the entry for key to destination, returns False on a miss."""
+        path = self.get(key)
+        if path is None:
+            return False
+        shutil.copyfile(path, destination)
+        return True
+
+    def get_bytes(self, key) -> Optional[bytes]:
+        """Read the entry for key, or None on a miss."""
+        path = self.get(key)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put_bytes(self, key, data: bytes):
+        path = self.path_for(key)
+        # write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._replace(tmp_path, path)
+        return path
+
+    def put_file(self, key, source_path):
+        path = self.path_for(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        self._replace(tmp_path, path)
+        return path
+
+    def _replace(self, tmp_path, path):
+        """Move a written entry into place and add it to the running total, evicting if that goes over max_bytes."""
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)  # overwriting an entry
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += size
+            self._puts_since_evict += 1
+            needs_evict = self._total_bytes > self.max_bytes or self._puts_since_evict >= self.sweep_every
+        if needs_evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then if the cache is over max_bytes the least recently used ones until it's back under
+        90% of it.
+        Also recounts the running total, which can drift if another process writes to the same directory.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if self._is_expired(stat, now):
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                self._remove(path)
+                total -= size
+                if total <= self.max_bytes * 0.9:
+                    break
+        with self._lock:
+            self._total_bytes = total
+            self._puts_since_evict = 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
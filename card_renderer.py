@@ -0,0 +1,111 @@
+from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from reddit_lib import MetaPost, MetaComment
+import os
+
+# Draws Reddit style mobile cards straight from the post/comment text, so no browser is needed to get an image.
+CARD_WIDTH = 1080
+PADDING = 48
+LINE_SPACING = 12
+BACKGROUND_COLOUR = (255, 255, 255)
+TEXT_COLOUR = (28, 28, 28)
+META_COLOUR = (120, 124, 126)
+
+font_path = os.environ.get("card_font", "DejaVuSans.ttf")
+bold_font_path = os.environ.get("card_bold_font", "DejaVuSans-Bold.ttf")
+_fonts = {}
+
+
+def _font(path, size):
+    """Load a font once per size, falling back to Pillow's built in font if the TrueType font isn't installed."""
+    if (path, size) not in _fonts:
+        try:
+            _fonts[(path, size)] = ImageFont.truetype(path, size)
+        except OSError:
+            _fonts[(path, size)] = ImageFont.load_default(size=size)
+    return _fonts[(path, size)]
+
+
+def wrap_text(text, font, max_width):
+    """Greedily wrap text into lines no wider than max_width, keeping the paragraphs of the original text."""
+    measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if measure.textlength(candidate, font=font) <= max_width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # break up words that are wider than the card on their own, e.g. links
+            while measure.textlength(word, font=font) > max_width:
+                cut = len(word)
+                while cut > 1 and measure.textlength(word[:cut], font=font) > max_width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def render_card(sections, width=CARD_WIDTH) -> Image.Image:
+    """
+    Draw a card from a list of (text, font, colour) sections, stacked top to bottom with wrapping.
+    The card is as tall as its content.
+    """
+    max_text_width = width - 2 * PADDING
+    laid_out = []
+    height = PADDING
+    for text, font, colour in sections:
+        line_height = sum(font.getmetrics()) + LINE_SPACING
+        lines = wrap_text(text, font, max_text_width)
+        laid_out.append((lines, font, colour, line_height))
+        height += line_height * len(lines) + LINE_SPACING
+    height += PADDING
+
+    card = Image.new("RGB", (width, height), BACKGROUND_COLOUR)
+    draw = ImageDraw.Draw(card)
+    y = PADDING
+    for lines, font, colour, line_height in laid_out:
+        for line in lines:
+            draw.text((PADDING, y), line, font=font, fill=colour)
+            y += line_height
+        y += LINE_SPACING
+    return card
+
+
+def _finish_card(card: Image.Image, image_path):
+    """Save the card if image_path is given, and return it as a BGR array like cv2 would have decoded it."""
+    if image_path is not None:
+        card.save(image_path)
+    return np.ascontiguousarray(np.asarray(card)[:, :, ::-1])
+
+
+def render_post_card(meta_post: MetaPost, image_path, subreddit):
+    """
+    Render the card for a post (subreddit and author line, title, score).
+    Returns it as a BGR array, and saves it to image_path unless that is None.
+    """
+    author = f" • u/{meta_post.author}" if meta_post.author else ""
+    card = render_card([
+        (f"r/{subreddit}{author}", _font(font_path, 32), META_COLOUR),
+        (meta_post.text, _font(bold_font_path, 52), TEXT_COLOUR),
+        (f"{meta_post.score} upvotes", _font(font_path, 32), META_COLOUR),
+    ])
+    return _finish_card(card, image_path)
+
+
+def render_comment_card(meta_comment: MetaComment, image_path):
+    """
+    Render the card for a comment (author line, body, score).
+    Returns it as a BGR array, and saves it to image_path unless that is None.
+    """
+    sections = [(meta_comment.author or "[deleted]", _font(bold_font_path, 32), META_COLOUR),
+                (meta_comment.text, _font(font_path, 42), TEXT_COLOUR)]
+    if meta_comment.score is not None:
+        sections.append((f"{meta_comment.score} points", _font(font_path, 32), META_COLOUR))
+    card = render_card(sections)
+    return _finish_card(card, image_path)
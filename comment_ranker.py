@@ -0,0 +1,139 @@
+import ml_data_writer
+from reddit_lib import MetaComment
+import numpy as np
+import os
+import re
+import threading
+import zlib
+
+# Scores comments by how likely we are to pick them, from the accept/reject labels ml_data_writer logs while curating.
+# Words and word pairs are hashed into a fixed size feature vector and fed to a logistic regression, everything in
+# numpy so scoring a whole post's comments is a couple of array operations.
+model_path = "ML/comment_ranker.npz"
+n_features = 2 ** 16
+top_k = int(os.environ.get("ranker_top_k", 5))  # how many comments the bot suggests
+_token_pattern = re.compile(r"[a-z0-9']+")
+
+
+def _hash(token):
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def tokenize(text):
+    """Lowercased words plus neighbouring word pairs."""
+    words = _token_pattern.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class CommentRanker:
+    """A hashed bag of words logistic regression. The last two weights are for the log word count and a bias."""
+
+    def __init__(self, weights=None):
+        self.weights = np.zeros(n_features + 2) if weights is None else weights
+
+    @staticmethod
+    def features(texts):
+        """
+        Sparse features for a batch of texts as flat (row, column, value) arrays. Each token adds +-1 to its bucket,
+        the sign coming from another bit of the hash so collisions tend to cancel out.
+        """
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            hashes = [_hash(token) for token in tokens]
+            rows.extend([row] * (len(hashes) + 2))
+            columns.extend(h % n_features for h in hashes)
+            values.extend(1.0 if h & 0x80000000 else -1.0 for h in hashes)
+            columns.extend((n_features, n_features + 1))
+            values.extend((np.log1p(len(tokens)), 1.0))
+        return np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64), np.array(values)
+
+    def _margins(self, rows, columns, values, n):
+        return np.bincount(rows, weights=self.weights[columns] * values, minlength=n)
+
+    def fit(self, texts, labels, epochs=300, learning_rate=0.5, l2=1e-4):
+        """Full batch gradient descent on the log loss, with the classes weighted so rejects don't drown out picks."""
+        labels = np.asarray(labels, dtype=np.float64)
+        n = len(labels)
+        rows, columns, values = self.features(texts)
+        positives = labels.sum()
+        sample_weights = np.where(labels == 1, n / (2 * max(positives, 1)), n / (2 * max(n - positives, 1)))
+        self.weights = np.zeros(n_features + 2)
+        for _ in range(epochs):
+            probabilities = 1 / (1 + np.exp(-self._margins(rows, columns, values, n)))
+            errors = (probabilities - labels) * sample_weights / n
+            gradient = np.bincount(columns, weights=errors[rows] * values, minlength=n_features + 2)
+            gradient[:n_features] += l2 * self.weights[:n_features]
+            self.weights -= learning_rate * gradient
+        return self
+
+    def score(self, texts) -> np.ndarray:
+        """Probability that each text would be picked."""
+        if not texts:
+            return np.zeros(0)
+        rows, columns, values = self.features(texts)
+        return 1 / (1 + np.exp(-self._margins(rows, columns, values, len(texts))))
+
+    def save(self, path, signature):
+        np.savez_compressed(path, weights=self.weights, signature=np.array(signature))
+
+    @classmethod
+    def load(cls, path, signature):
+        """Load a saved model, or None if there isn't one or it was trained on different labels."""
+        try:
+            with np.load(path) as saved:
+                if saved["signature"].tolist() != list(signature) or saved["weights"].shape != (n_features + 2,):
+                    return None
+                return cls(saved["weights"])
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+
+
+_ranker = None
+_ranker_signature = None
+_lock = threading.Lock()
+
+
+def _labels_signature():
+    """Size and mtime of every comment label file, so the model is retrained when new labels are flushed."""
+    signature = []
+    for path in (ml_data_writer.comments_file, ml_data_writer.comments_labels_file):
+        try:
+            stat = os.stat(path)
+            signature += [stat.st_size, stat.st_mtime]
+        except FileNotFoundError:
+            signature += [0, 0]
+    return signature
+
+
+def get_ranker():
+    """The model for the current labels, loading or training it if the labels changed. None if there are no labels."""
+    global _ranker, _ranker_signature
+    with _lock:
+        signature = _labels_signature()
+        if signature == _ranker_signature:
+            return _ranker
+        ranker = CommentRanker.load(model_path, signature)
+        if ranker is None:
+            labels = ml_data_writer.load_comment_labels()
+            if len(labels["accepted"]) == 0 or labels["accepted"].all() or not labels["accepted"].any():
+                ranker = None  # nothing to learn from until we have both picks and rejects
+            else:
+                print(f"Training comment ranker on {len(labels['accepted'])} labelled comments")
+                ranker = CommentRanker().fit(labels["text"].tolist(), labels["accepted"])
+                ranker.save(model_path, signature)
+        _ranker, _ranker_signature = ranker, signature
+        return ranker
+
+
+def rank_comments(comments: list[MetaComment]):
+    """
+    Sort comments from most to least likely to be picked.
+    :return: (sorted comments, their scores), the original order with no scores if there is no model yet
+    """
+    ranker = get_ranker()
+    if ranker is None:
+        return list(comments), None
+    scores = ranker.score([comment.text for comment in comments])
+    order = np.argsort(-scores, kind="stable")
+    return [comments[i] for i in order], scores[order]
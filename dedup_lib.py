@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Optional
+import numpy as np
+
+# Remembers which posts we already made videos of, and a MinHash of their titles so reposts of the same question
+# with slightly different wording are caught too. Near duplicate lookups go through LSH buckets, so a lookup only
+# compares against the few titles that share a bucket instead of the whole index.
+num_hashes = 64
+bands = 16  # 16 bands of 4 rows, titles with a jaccard similarity past ~0.5 usually share a bucket
+rows_per_band = num_hashes // bands
+shingle_size = 4
+_prime = (1 << 31) - 1
+_random = np.random.RandomState(1)
+_a = _random.randint(1, _prime, size=num_hashes).astype(np.uint64)
+_b = _random.randint(0, _prime, size=num_hashes).astype(np.uint64)
+
+
+def normalize_title(title):
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", title.lower()).split())
+
+
+def normalize_id(post_id):
+    return post_id[3:] if post_id.startswith("t3_") else post_id
+
+
+def title_signature(title) -> np.ndarray:
+    """MinHash of the title's character shingles."""
+    text = normalize_title(title)
+    shingles = {text[i:i + shingle_size] for i in range(max(len(text) - shingle_size + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                         count=len(shingles))
+    return ((_a[:, None] * hashes[None, :] + _b[:, None]) % _prime).min(axis=1).astype(np.uint32)
+
+
+class DedupIndex:
+    """
+    Post IDs and title signatures of produced posts, kept in memory and appended to a jsonl file as posts are added.
+    """
+
+    def __init__(self, path=None, threshold=0.8):
+        self.path = path
+        self.threshold = threshold
+        self._ids = set()
+        self._titles = {}
+        self._signatures = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a write that was cut off
+                self._index(entry["post_id"], entry["title"], np.array(entry["signature"], dtype=np.uint32))
+
+    def _index(self, post_id, title, signature):
+        self._ids.add(post_id)
+        self._titles[normalize_title(title)] = post_id
+        self._signatures[post_id] = signature
+        for band in range(bands):
+            key = (band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes())
+            self._buckets.setdefault(key, []).append(post_id)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, post_id, title):
+        """Record a produced post."""
+        post_id = normalize_id(post_id)
+        with self._lock:
+            if post_id in self._ids:
+                return
+            signature = title_signature(title)
+            self._index(post_id, title, signature)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"post_id": post_id, "title": title, "signature": signature.tolist(),
+                                        "produced_at": time.time()}) + "\n")
+
+    def is_produced(self, post_id):
+        return normalize_id(post_id) in self._ids
+
+    def find_near_duplicate(self, title) -> Optional[str]:
+        """The ID of a produced post whose title is (nearly) the same as title, or None."""
+        exact = self._titles.get(normalize_title(title))
+        if exact is not None:
+            return exact
+        if not self._ids:
+            return None
+        signature = title_signature(title)
+        checked = set()
+        for band in range(bands):
+            key = (band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes())
+            for candidate in self._buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        return None
+
+    def seen(self, post_id, title):
+        """Whether the post, or a near duplicate of it, was produced already."""
+        if self.is_produced(post_id):
+            print(f"Skipping post {post_id}, already produced")
+            return True
+        duplicate = self.find_near_duplicate(title)
+        if duplicate is not None:
+            print(f"Skipping post {post_id}, near duplicate of produced post {duplicate}")
+            return True
+        return False
+
+    def filter(self, meta_posts):
+        """Drop the MetaPosts that were produced already."""
+        return [meta_post for meta_post in meta_posts if not self.seen(meta_post.post_id, meta_post.text)]
+
+
+produced_posts = DedupIndex(os.environ.get("dedup_index_path", "produced_posts.jsonl"),
+                            threshold=float(os.environ.get("dedup_similarity", 0.8)))
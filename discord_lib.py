@@ -1,6 +1,10 @@
 import discord
 import ml_data_writer
+import metrics_lib
+import comment_ranker
 import asyncio
+import io
+import cv2
 from reddit_lib import PostWithComments, MetaComment, MetaPost
 import os
 
@@ -8,6 +12,61 @@ channel_id = 1092145376846434405
 bot_token = os.environ.get('DISCORD_TOKEN')
 
 
+class DiscordSession:
+    """
+    One logged in client shared by every curate and notify call. It connects on first use and stays connected, so
+    a batch of posts only does the gateway login and ready handshake once.
+    """
+
+    def __init__(self):
+        self.client = None
+        self._ready = None
+        self._task = None
+        self._lock = None
+
+    async def channel(self):
+        """Get the curation channel, connecting first if we aren't connected yet."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.client is None or self.client.is_closed():
+                self.client = discord.Client(intents=discord.Intents.all())
+                self._ready = asyncio.Event()
+
+                @self.client.event
+                async def on_ready():
+                    self._ready.set()
+
+                self._task = asyncio.create_task(self.client.start(bot_token))
+            if not self._ready.is_set():
+                ready = asyncio.ensure_future(self._ready.wait())
+                await asyncio.wait({ready, self._task}, return_when=asyncio.FIRST_COMPLETED)
+                if not ready.done():
+                    ready.cancel()
+                    self._task.result()  # raises the login error
+                    raise RuntimeError("Discord client stopped before it was ready")
+        return self.client.get_channel(channel_id)
+
+    async def close(self):
+        if self.client is not None and not self.client.is_closed():
+            await self.client.close()
+            await self._task
+
+
+session = DiscordSession()
+
+
+def image_file(meta_post: MetaPost):
+    """A discord.File of the post's image, from memory if it was never written to disk."""
+    if meta_post.path_to_image is not None:
+        return discord.File(meta_post.path_to_image)
+    image = meta_post.image
+    if not isinstance(image, bytes):  # card_renderer arrays
+        image = cv2.imencode(".png", image)[1].tobytes()
+    return discord.File(io.BytesIO(image), filename=f"{meta_post.post_id}.png")
+
+
+@metrics_lib.traced("discord.curate")
 async def curate(post_with_comments: PostWithComments, callback):
     """
         Send post and comments in text form to Discord, and wait for emoji reactions
@@ -16,22 +75,27 @@ async def curate(post_with_comments: PostWithComments, callback):
         :param callback: A callback function that takes a curated PostWithComments object as an argument
     """
 
-    client = discord.Client(intents=discord.Intents.all())
+    channel = await session.channel()
+    client = session.client
 
     future = asyncio.Future()
     future.add_done_callback(callback)
 
     async def _curate(channel):
         comments: list[MetaComment] = post_with_comments.comments
+        # most likely picks first, the top few are marked as suggestions that 🤖 picks in one go
+        comments, scores = comment_ranker.rank_comments(comments)
+        suggested = comments[:comment_ranker.top_k] if scores is not None else []
         n = len(comments)
 
         # create the message with the question and answers
         await channel.send("##############################\nStarting AskReddit video!\n\n")
-        await channel.send(file=discord.File(post_with_comments.post.path_to_image))
+        await channel.send(file=image_file(post_with_comments.post))
         message = ""
         for i in range(n):
             tentative_message = message
-            tentative_message += f'{chr(65 + i)}: {comments[i].text}\n'
+            suggestion = f" ⭐ {scores[i]:.0%}" if comments[i] in suggested else ""
+            tentative_message += f'{chr(65 + i)}: {comments[i].text}{suggestion}\n'
             if len(tentative_message) > 2000:
                 await channel.send(message)
                 message = ""
@@ -39,6 +103,8 @@ async def curate(post_with_comments: PostWithComments, callback):
                 message = tentative_message
         message += '\nReact with the letters of your chosen answers and ✅ to confirm or ❌ to cancel. ' \
                    '\nYou can also react with 👍 to select all the comments.'
+        if suggested:
+            message += '\nReact with 🤖 to pick the suggested ⭐ comments.'
 
         sent_message = await channel.send(message)
 
@@ -48,11 +114,15 @@ async def curate(post_with_comments: PostWithComments, callback):
         await sent_message.add_reaction('✅')  # for confirming comment selection
         await sent_message.add_reaction('❌')  # for declining the post
         await sent_message.add_reaction('👍')  # for okaying all the comments
+        if suggested:
+            await sent_message.add_reaction('🤖')  # for picking the suggested comments
 
         letter_react_unicode = set([chr(127462 + i) for i in range(n)])
 
         def check(reaction, user):
-            return user != client.user and str(reaction.emoji) in letter_react_unicode.union({'✅', '❌', '👍'})
+            # other curations can be running at the same time, only listen to reactions on our message
+            return reaction.message.id == sent_message.id and user != client.user and \
+                str(reaction.emoji) in letter_react_unicode.union({'✅', '❌', '👍', '🤖'})
 
         while True:
             try:
@@ -62,13 +132,26 @@ async def curate(post_with_comments: PostWithComments, callback):
                     ml_data_writer.write_post_to_csv(post_with_comments.post, True)
                     for comment in comments:
                         ml_data_writer.write_comment_to_csv(comment, True)
+                    ml_data_writer.label_store.flush()
                     confirmation_message = f"Okayed all comments"
                     await channel.send(confirmation_message)
                     print(confirmation_message)
                     future.set_result(post_with_comments)
                     return
 
-                if str(reaction.emoji) == '✅':
+                if str(reaction.emoji) == '🤖':
+                    ml_data_writer.write_post_to_csv(post_with_comments.post, True)
+                    for comment in comments:
+                        ml_data_writer.write_comment_to_csv(comment, comment in suggested)
+                    ml_data_writer.label_store.flush()
+                    post_with_comments.comments = [comment for comment in post_with_comments.comments
+                                                   if comment in suggested]
+                    confirmation_message = f"Picked the {len(suggested)} suggested comments"
+                    await channel.send(confirmation_message)
+                    print(confirmation_message)
+                    future.set_result(post_with_comments)
+                    return
+                elif str(reaction.emoji) == '✅':
                     # update sent_message
                     sent_message = await channel.fetch_message(sent_message.id)
                     ml_data_writer.write_post_to_csv(post_with_comments.post, True)
@@ -80,7 +163,10 @@ async def curate(post_with_comments: PostWithComments, callback):
                             ml_data_writer.write_comment_to_csv(comment, True)
                         else:
                             ml_data_writer.write_comment_to_csv(comment, False)
-                    post_with_comments.comments = chosen_answers
+                    ml_data_writer.label_store.flush()
+                    # keep Reddit's order in the video, not the ranked order they were shown in
+                    post_with_comments.comments = [comment for comment in post_with_comments.comments
+                                                   if comment in chosen_answers]
 
                     confirmation_message = f"Picked comments {', '.join([str(reaction.emoji) for reaction in sent_message.reactions if str(reaction.emoji) in letter_react_unicode and reaction.count > 1])}"
                     await channel.send(confirmation_message)
@@ -91,38 +177,22 @@ async def curate(post_with_comments: PostWithComments, callback):
                 elif str(reaction.emoji) == '❌':
                     await channel.send("Declined post.")
                     ml_data_writer.write_post_to_csv(post_with_comments.post, False)
+                    ml_data_writer.label_store.flush()
                     future.set_result(None)
                     return
             except asyncio.TimeoutError:
                 future.set_result(None)
                 return None
 
-    @client.event
-    async def on_ready():
-        # using an on_ready callback was the only way for me to send a message for some reason (at least in a linear
-        # script)
-        channel = client.get_channel(channel_id)
-        await _curate(channel)
-        await client.close()
-
-    await client.start(bot_token)
+    await _curate(channel)
     return future
 
 
+@metrics_lib.traced("discord.notify")
 async def notify(message):
     """Function that just sends a message to the channel, to be used for exceptions etc."""
-    client = discord.Client(intents=discord.Intents.all())
-
-    async def _notify(channel):
-        await channel.send(message)
-
-    @client.event
-    async def on_ready():
-        channel = client.get_channel(channel_id)
-        await _notify(channel)
-        await client.close()
-
-    await client.start(bot_token)
+    channel = await session.channel()
+    await channel.send(message)
 
 
 def dummy_callback(future: asyncio.Future):
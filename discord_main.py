@@ -1,14 +1,18 @@
 import discord
 from discord.ext import commands
 import ml_data_writer
+import comment_ranker
 import asyncio
 import os
+import threading
 from dotenv import load_dotenv
 import trends_lib
 import reddit_lib
 import video_creator
 import youtube_lib
 import traceback
+import jobs_lib
+import dedup_lib
 
 
 async def main():
@@ -19,6 +23,47 @@ async def main():
     current_subreddit = None
     client = commands.Bot(intents=discord.Intents.all(), command_prefix="!")
     reddit = reddit_lib.create_reddit()
+    jobs = jobs_lib.PipelineJobs(max_videos=int(os.environ.get("max_concurrent_videos", 2)))
+    prefetch_screenshots = os.environ.get("prefetch_screenshots", "False") == "True"
+    prefetch_tasks = []
+    prefetch_cancelled = threading.Event()  # set to stop the screenshot prefetches of the current listing
+
+    def prefetch_screenshots_of(post, comments, subreddit, cancelled):
+        """Warm the screenshot cache for a post, checking between captures if the listing was replaced."""
+        if cancelled.is_set():
+            return
+        reddit_lib.capture_reddit_mobile_post_card(post.post_id, nsfw=post.nsfw)
+        if cancelled.is_set():
+            return
+        reddit_lib.capture_reddit_comments_mobile(post.post_id, [comment.comment_id for comment in comments],
+                                                  subreddit, cancelled=cancelled)
+
+    async def prefetch(post, subreddit, cancelled):
+        """Fetch a listed post's comments (and optionally warm the screenshot cache) so !pick doesn't wait on them."""
+        comments = await reddit_lib.cached_get_top_n_comments_from_post(reddit, post.post_id, 10)
+        if prefetch_screenshots:
+            # on the background thread, so prefetching never takes a worker from a video being made
+            await jobs.run_background(prefetch_screenshots_of, post, comments, subreddit, cancelled)
+
+    async def _prefetch_quietly(post, subreddit, cancelled):
+        try:
+            await prefetch(post, subreddit, cancelled)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Prefetching post {post.post_id} failed with error: {e}")
+
+    def start_prefetch(posts, subreddit):
+        """Prefetch every listed post in the background, cancelling the prefetches for the previous listing."""
+        nonlocal prefetch_cancelled
+        # cancelling the tasks drops the prefetches that haven't started, the event stops the one that is running
+        prefetch_cancelled.set()
+        for task in prefetch_tasks:
+            task.cancel()
+        prefetch_tasks.clear()
+        prefetch_cancelled = threading.Event()
+        for post in posts:
+            prefetch_tasks.append(asyncio.create_task(_prefetch_quietly(post, subreddit, prefetch_cancelled)))
 
     @client.event
     async def on_ready():
@@ -36,46 +81,51 @@ async def main():
         :return: None, sends to channel
         """
         if arg1.isdigit():
-            trends = trends_lib.get_top_n_trends(int(arg1))
+            trends = await jobs.run(trends_lib.get_top_n_trends, int(arg1))
         else:
-            trends = trends_lib.get_top_n_trends()
+            trends = await jobs.run(trends_lib.get_top_n_trends)
         await ctx.send('Top trends: ' + '\n '.join(trends))
 
     @client.command(aliases=['ask'],
                     description="Get top posts from AskReddit. Can pass time filter e.g. day, hour, month and a number "
-                                "of posts. Default: !askreddit day 5")
-    async def askreddit(ctx, arg1="day", arg2=5):
+                                "of posts, add refresh to skip the cache. Default: !askreddit day 5")
+    async def askreddit(ctx, arg1="day", arg2=5, arg3=""):
         """
         Fetches top posts from AskReddit and sets them as the current posts
         :param ctx: Discord context
         :param arg1: time filter
         :param arg2: number of posts
+        :param arg3: "refresh" to fetch from Reddit even if the listing is cached
         :return: None, sets current_posts
         """
         print("!askreddit called")
         if arg1 not in ["all", "day", "hour", "month", "week", "year"]:
             await ctx.send('Invalid time filter, please try again')
             return
-        posts = await reddit_lib.get_top_n_posts(reddit, "askreddit", arg2, time_filter=arg1)
+        posts = await reddit_lib.cached_get_top_n_posts(reddit, "askreddit", arg2, time_filter=arg1,
+                                                        refresh=arg3 == "refresh")
         global current_posts
         current_posts = posts
         global current_subreddit
         current_subreddit = "askreddit"
+        start_prefetch(current_posts, current_subreddit)
         await ctx.send(f"Here are the top {arg2} posts in the last {arg1}:")
         await print_current_posts(ctx)
         await ctx.send("Use !pick <number> to pick a post to fetch comments for.")
 
-    @client.command(aliases=['s'], description="Search a subreddit for a query, sets current posts to the results")
-    async def search(ctx, arg1="askreddit", arg2=None, arg3=5):
+    @client.command(aliases=['s'], description="Search a subreddit for a query, sets current posts to the results. "
+                                               "Add refresh to skip the cache.")
+    async def search(ctx, arg1="askreddit", arg2=None, arg3=5, arg4=""):
         print("!search called")
         if arg2 is None:
             await ctx.send("Please enter a query as the second argument")
             return
-        posts = await reddit_lib.search_subreddit(reddit, arg1, arg2, n=5)
+        posts = await reddit_lib.cached_search_subreddit(reddit, arg1, arg2, n=5, refresh=arg4 == "refresh")
         global current_posts
         current_posts = posts
         global current_subreddit
         current_subreddit = arg1
+        start_prefetch(current_posts, current_subreddit)
         await ctx.send(f"Here are the top {arg3} posts in {arg1} for {arg2}:")
         await print_current_posts(ctx)
         await ctx.send("Use !pick <number> to pick a post to fetch comments for.")
@@ -96,8 +146,9 @@ async def main():
         await ctx.send(message)
 
     @client.command(aliases=['p', "comments"],
-                    description="Pick a post from the current stored posts to get comments for")
-    async def pick(ctx, arg1="1"):
+                    description="Pick a post from the current stored posts to get comments for. Add refresh to skip "
+                                "the cache.")
+    async def pick(ctx, arg1="1", arg2=""):
         print("!pick called")
         if not arg1.isdigit():
             await ctx.send("Please enter a number as the first argument")
@@ -112,17 +163,29 @@ async def main():
         post = current_posts[int(arg1) - 1]
         await ctx.send(f"Fetching comments for post: \"{post.text}\"")
 
-        comments = await reddit_lib.async_get_top_n_comments_from_post(reddit, post.post_id, 10)
+        comments = await reddit_lib.cached_get_top_n_comments_from_post(reddit, post.post_id, 10,
+                                                                        refresh=arg2 == "refresh")
         global current_subreddit
         post_with_comments = reddit_lib.PostWithComments(post, comments, current_subreddit)
         curated_post = await curate_post_comments(ctx, post_with_comments)
         if curated_post is None:
             await ctx.send("Post cancelled.")
             return
-        status = await ctx.send("Comments chosen, fetching images...")
-        with_images = reddit_lib.get_images_for_post_with_comments(curated_post)
-        await status.edit(content="Images fetched, creating video")
-        video_path = video_creator.make_video_from_post_with_comments(with_images)
+        if jobs.busy:
+            status = await ctx.send(f"Comments chosen, waiting for one of the {jobs.max_videos} videos in progress "
+                                    f"to finish...")
+        else:
+            status = await ctx.send("Comments chosen, fetching images...")
+        async with jobs.slot():
+            await status.edit(content="Comments chosen, fetching images...")
+            with_images = await jobs.run(reddit_lib.get_images_for_post_with_comments, curated_post)
+            if with_images is None:
+                await status.edit(content="Failed to capture any comments for this post.")
+                return
+            await status.edit(content="Images fetched, creating video")
+            video_path = await jobs.run(video_creator.make_video_from_post_with_comments, with_images,
+                                        progress=jobs.progress_reporter(status, "Creating video: "))
+        await status.edit(content="Video done!")
         print("Posting video to Discord for approval/upload.")
         await confirm_video(ctx, video_path, curated_post)
 
@@ -136,13 +199,17 @@ async def main():
         # future = asyncio.Future()
         # future.add_done_callback(callback)
         comments: list[reddit_lib.MetaComment] = post_with_comments.comments
+        # most likely picks first, the top few are marked as suggestions that 🤖 picks in one go
+        comments, scores = comment_ranker.rank_comments(comments)
+        suggested = comments[:comment_ranker.top_k] if scores is not None else []
         n = len(comments)
 
         # create the message with the question and answers
         message = ""
         for i in range(n):
             tentative_message = message  # tentative message logic is just for if we go over the 2000 character limit
-            tentative_message += f'{chr(65 + i)}: {comments[i].text}\n'
+            suggestion = f" ⭐ {scores[i]:.0%}" if comments[i] in suggested else ""
+            tentative_message += f'{chr(65 + i)}: {comments[i].text}{suggestion}\n'
             if len(tentative_message) > 2000:
                 await ctx.send(message)
                 message = ""
@@ -150,6 +217,8 @@ async def main():
                 message = tentative_message
         message += '\nReact with the letters of your chosen answers and ✅ to confirm or ❌ to cancel. ' \
                    '\nYou can also react with 👍 to select all the comments.'
+        if suggested:
+            message += '\nReact with 🤖 to pick the suggested ⭐ comments.'
 
         sent_message = await ctx.send(message)
 
@@ -159,11 +228,15 @@ async def main():
         await sent_message.add_reaction('✅')  # for confirming comment selection
         await sent_message.add_reaction('❌')  # for declining the post
         await sent_message.add_reaction('👍')  # for okaying all the comments
+        if suggested:
+            await sent_message.add_reaction('🤖')  # for picking the suggested comments
 
         letter_react_unicode = set([chr(127462 + i) for i in range(n)])
 
         def check(reaction, user):
-            return user != client.user and str(reaction.emoji) in letter_react_unicode.union({'✅', '❌', '👍'})
+            # several !pick curations can be waiting at once, only listen to reactions on our message
+            return reaction.message.id == sent_message.id and user != client.user and \
+                str(reaction.emoji) in letter_react_unicode.union({'✅', '❌', '👍', '🤖'})
 
         while True:
             try:
@@ -173,10 +246,22 @@ async def main():
                     ml_data_writer.write_post_to_csv(post_with_comments.post, True)
                     for comment in comments:
                         ml_data_writer.write_comment_to_csv(comment, True)
+                    ml_data_writer.label_store.flush()
                     confirmation_message = f"Okayed all comments"
                     await ctx.send(confirmation_message)
                     print(confirmation_message)
                     return post_with_comments
+                elif str(reaction.emoji) == '🤖':
+                    ml_data_writer.write_post_to_csv(post_with_comments.post, True)
+                    for comment in comments:
+                        ml_data_writer.write_comment_to_csv(comment, comment in suggested)
+                    ml_data_writer.label_store.flush()
+                    post_with_comments.comments = [comment for comment in post_with_comments.comments
+                                                   if comment in suggested]
+                    confirmation_message = f"Picked the {len(suggested)} suggested comments"
+                    await ctx.send(confirmation_message)
+                    print(confirmation_message)
+                    return post_with_comments
                 elif str(reaction.emoji) == '✅':
                     print("Received check reaction")
                     # update sent_message
@@ -190,7 +275,10 @@ async def main():
                             ml_data_writer.write_comment_to_csv(comment, True)
                         else:
                             ml_data_writer.write_comment_to_csv(comment, False)
-                    post_with_comments.comments = chosen_answers
+                    ml_data_writer.label_store.flush()
+                    # keep Reddit's order in the video, not the ranked order they were shown in
+                    post_with_comments.comments = [comment for comment in post_with_comments.comments
+                                                   if comment in chosen_answers]
 
                     confirmation_message = f"Picked comments {', '.join([str(reaction.emoji) for reaction in sent_message.reactions if str(reaction.emoji) in letter_react_unicode and reaction.count > 1])}"
                     await ctx.send(confirmation_message)
@@ -200,6 +288,7 @@ async def main():
                     print("Received cancel reaction")
                     await ctx.send("Declined post.")
                     ml_data_writer.write_post_to_csv(post_with_comments.post, False)
+                    ml_data_writer.label_store.flush()
                     return
             except asyncio.TimeoutError:
                 traceback.print_exc()
@@ -215,7 +304,10 @@ async def main():
             video.close() # maybe necessary to be able to open the file while uploading it
             f.close()
             if post_with_comments.subreddit == 'askreddit':
-                yt_link = youtube_lib.upload_to_askreddit_channel(video_path, post_with_comments.post.text)
+                yt_link = await jobs.run(youtube_lib.upload_to_askreddit_channel, video_path,
+                                         post_with_comments.post.text)
+                if yt_link is not None:  # None on a dry run
+                    dedup_lib.produced_posts.add(post_with_comments.post.post_id, post_with_comments.post.text)
                 await interaction.response.edit_message(content=f'Uploaded to YouTube: {yt_link}')
 
         async def get_path_button_callback(interaction: discord.Interaction):
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+class PipelineJobs:
+    """
+    Runs the blocking pipeline stages (capture, TTS, render, upload) on worker threads so the bot's event loop stays
+    free to answer commands and reactions. At most max_videos videos are made at once, the rest wait for a slot.
+    Background work like prefetching runs on its own single thread, so it never holds up a video.
+    """
+
+    def __init__(self, max_videos=2, workers=4):
+        self.max_videos = max_videos
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self._background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+        self._slots = asyncio.Semaphore(max_videos)
+        self.active = 0
+
+    @property
+    def busy(self):
+        return self.active >= self.max_videos
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the video slots for the duration of the block."""
+        async with self._slots:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking function on a worker thread and wait for its result without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def run_background(self, func, *args, **kwargs):
+        """
+        Like run, but on the background thread, one function at a time. Cancelling the wait only stops a function
+        that hasn't started yet, so long running ones should check for cancellation themselves.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._background_executor, functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    def progress_reporter(message, prefix=""):
+        """
+        Make a callback that edits a Discord message to show progress. It can be called from worker threads,
+        the edit is scheduled on the event loop that is running now.
+        """
+        loop = asyncio.get_running_loop()
+
+        def report(text):
+            asyncio.run_coroutine_threadsafe(message.edit(content=f"{prefix}{text}"), loop)
+
+        return report
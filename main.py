@@ -2,34 +2,116 @@ import reddit_lib
 import video_creator
 import discord_lib
 import asyncio
+import traceback
 from dotenv import load_dotenv
 from typing import List
 load_dotenv()
 
+# how many posts can wait between two stages, keeps every stage busy without capturing far ahead of curation
+stage_queue_size = 1
+
+
+async def _stage(name, inbox: asyncio.Queue, outbox: asyncio.Queue, work):
+    """
+    Run work on each item from inbox and pass the results on to outbox, until a None item ends the stage.
+    A post that fails or returns None is dropped, the rest of the batch carries on.
+    """
+    try:
+        while True:
+            item = await inbox.get()
+            if item is None:
+                break
+            try:
+                result = await work(item)
+            except Exception as e:
+                print(f"AskReddit {name} stage failed with error: {e}")
+                traceback.print_exc()
+                try:
+                    await discord_lib.notify(f"AskReddit {name} stage failed with error: {e}")
+                except Exception as notify_error:
+                    print(f"Failed to notify Discord: {notify_error}")
+                continue
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+    finally:
+        # always end the next stage, otherwise it (and the gather) would wait forever
+        if outbox is not None:
+            await outbox.put(None)
+
+
+async def askreddit_pipeline(n, m, prime: List[str] = None):
+    """
+    Fetch -> capture -> curate -> TTS -> render -> upload, each stage working on a different post at the same time.
+    The stages are joined by small queues, so e.g. post 2 is captured and voiced while post 1 renders and post 3
+    waits for curation.
+    """
+    if m > 17:
+        raise RuntimeError("M cant be greater than 17, or else discord won't have enough reactions.")
+    reddit = reddit_lib.reddit
+    to_capture, to_curate, to_voice, to_render, to_upload = [asyncio.Queue(maxsize=stage_queue_size)
+                                                             for _ in range(5)]
+
+    async def fetch():
+        if prime is None:
+            print(f"1. Getting top {n} posts from r/AskReddit with {m} comments each")
+            posts = await reddit_lib.get_top_n_posts(reddit, "AskReddit", n)
+        else:
+            print(f"Using ids from prime")
+            posts = await reddit_lib.get_posts(reddit, prime)
+        for post in posts:
+            comments = await reddit_lib.async_get_top_n_comments_from_post(reddit, post.post_id, m)
+            await to_capture.put(reddit_lib.PostWithComments(post, comments, "AskReddit"))
+        await to_capture.put(None)
+
+    async def capture(post_with_comments):
+        return await asyncio.to_thread(reddit_lib.get_images_for_post_with_comments, post_with_comments)
+
+    async def curate(post_with_comments):
+        print(f"2. Sending post {post_with_comments.post.post_id} to Discord for curation")
+        curated = await discord_lib.curate(post_with_comments, lambda future: None)
+        return curated.result()
+
+    async def voice(post_with_comments):
+        audio_paths = await asyncio.to_thread(video_creator.make_mp3s, post_with_comments)
+        return post_with_comments, audio_paths
+
+    async def render(voiced):
+        post_with_comments, audio_paths = voiced
+        video_path = await asyncio.to_thread(video_creator.make_video_from_post_with_comments, post_with_comments,
+                                             audio_paths=audio_paths)
+        return post_with_comments, video_path
+
+    async def upload(rendered):
+        post_with_comments, video_path = rendered
+        await asyncio.to_thread(video_creator.post_video, post_with_comments, video_path)
+
+    await asyncio.gather(fetch(),
+                         _stage("capture", to_capture, to_curate, capture),
+                         _stage("curation", to_curate, to_voice, curate),
+                         _stage("TTS", to_voice, to_render, voice),
+                         _stage("render", to_render, to_upload, render),
+                         _stage("upload", to_upload, None, upload))
+
 
 # functions that each produce a video/videos for the YouTube channels
 def make_askreddit_video(prime: List[str]=None):
     """Make a video for the AskReddit channel.
     Prime should be a list of Reddit post ids or None.
     """
+    loop = asyncio.get_event_loop()
     try:
         if prime is None:
             # 1. Get the popular recent posts
-            posts_with_comments = reddit_lib.get_n_posts_with_m_comments("AskReddit", 5, 10)
+            loop.run_until_complete(askreddit_pipeline(5, 10))
         else:
             # use the post(s) that were given to us
-            posts_with_comments = reddit_lib.get_n_posts_with_m_comments("AskReddit", 1, 17, prime=prime)
-
-        # 2. send to Discord for curation
-        for index, post_with_comment in enumerate(posts_with_comments):
-            print(f"2. Sending post {index + 1} to Discord for curation")
-            loop = asyncio.get_event_loop()
-            # 3. Callback function makes video and posts it. Chooses where to post it using the subreddit
-            loop.run_until_complete(discord_lib.curate(post_with_comment, video_creator.make_and_post_video))
+            loop.run_until_complete(askreddit_pipeline(1, 17, prime=prime))
     except Exception as e:
         print(f"Failed to make AskReddit video with error: {e}")
-        discord_lib.notify(f"Failed to make AskReddit video with error: {e}")
+        loop.run_until_complete(discord_lib.notify(f"Failed to make AskReddit video with error: {e}"))
         raise e
+    finally:
+        loop.run_until_complete(discord_lib.session.close())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,222 @@
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans around the pipeline stages plus a few counters (retries, cache hits, failures).
+# Stage timings and counters are written in Prometheus text format to metrics_path every flush_interval seconds and
+# at exit, and served on metrics_port if it's set. Every finished span is also appended to trace_path as a line of
+# json with its post/comment IDs, so one slow video can be traced stage by stage.
+metrics_path = os.environ.get("metrics_path", "metrics.prom")
+trace_path = os.environ.get("trace_path", "traces.jsonl")  # empty to turn off the per span log
+# resolved now so a later chdir doesn't change where they're written
+metrics_path, trace_path = (os.path.abspath(path) if path else path for path in (metrics_path, trace_path))
+metrics_port = os.environ.get("metrics_port")
+flush_interval = float(os.environ.get("metrics_flush_interval", 15))
+duration_buckets = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+# arguments that are copied onto a span as attributes when a traced function is called with them
+attribute_names = ("post_id", "comment_id", "subreddit", "query", "video_path")
+
+_lock = threading.Lock()
+_counters = {}
+_durations = {}  # stage -> [count, sum, max, bucket counts]
+_spans = []
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_flusher = None
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter, e.g. increment("retries_total", stage="tts")."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _start_flusher()
+
+
+def _observe(stage, duration):
+    with _lock:
+        entry = _durations.get(stage)
+        if entry is None:
+            entry = _durations[stage] = [0, 0.0, 0.0, [0] * len(duration_buckets)]
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+        for index, bound in enumerate(duration_buckets):
+            if duration <= bound:
+                entry[3][index] += 1
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a stage. Spans opened inside it (in the same thread or asyncio task) are recorded as its children.
+    A span that raises is counted in stage_failures_total.
+    """
+    parent = _current_span.get()
+    record = {"name": name, "span_id": next(_span_ids), "parent_id": parent["span_id"] if parent else None,
+              "attributes": {key: value for key, value in attributes.items() if value is not None},
+              "thread": threading.current_thread().name, "start": time.time(), "status": "ok"}
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except (Exception, asyncio.CancelledError) as e:
+        record["status"] = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        record["error"] = repr(e)
+        if record["status"] == "error":
+            increment("stage_failures_total", stage=name)
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration"] = time.perf_counter() - start
+        _observe(name, record["duration"])
+        if trace_path:
+            with _lock:
+                _spans.append(record)
+        _start_flusher()
+
+
+def _attributes(bound_arguments):
+    """Pull IDs out of a call's arguments, from the names above and any MetaPost/MetaComment/PostWithComments."""
+    attributes = {}
+    for name, value in bound_arguments.items():
+        if name in attribute_names and isinstance(value, (str, int)):
+            attributes[name] = value
+        elif hasattr(value, "post") and hasattr(value, "comments"):  # PostWithComments
+            attributes["post_id"] = value.post.post_id
+            attributes["comments"] = len(value.comments)
+        elif hasattr(value, "comment_id"):
+            attributes.setdefault("post_id", value.post_id)
+            attributes["comment_id"] = value.comment_id
+        elif hasattr(value, "post_id"):
+            attributes.setdefault("post_id", value.post_id)
+    return attributes
+
+
+def traced(name):
+    """Decorator that runs every call of a function (sync or async) in a span, with the IDs from its arguments."""
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def call_attributes(args, kwargs):
+            try:
+                return _attributes(signature.bind(*args, **kwargs).arguments)
+            except TypeError:
+                return {}
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **call_attributes(args, kwargs)):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **call_attributes(args, kwargs)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def render():
+    """All the metrics in Prometheus text format."""
+    with _lock:
+        counters = dict(_counters)
+        durations = {stage: (count, total, maximum, list(buckets))
+                     for stage, (count, total, maximum, buckets) in _durations.items()}
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    if durations:
+        lines.append("# TYPE stage_duration_seconds histogram")
+        for stage, (count, total, _, buckets) in sorted(durations.items()):
+            for bound, bucket_count in zip(duration_buckets, buckets):
+                lines.append(f'stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'stage_duration_seconds_count{{stage="{stage}"}} {count}')
+        lines.append("# TYPE stage_duration_seconds_max gauge")
+        for stage, (_, _, maximum, _) in sorted(durations.items()):
+            lines.append(f'stage_duration_seconds_max{{stage="{stage}"}} {maximum}')
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """Write the metrics file and append the finished spans to the trace log."""
+    with _lock:
+        spans, _spans[:] = list(_spans), []
+    if spans:
+        with open(trace_path, "a", encoding="utf-8") as f:
+            for record in spans:
+                f.write(json.dumps(record, default=str) + "\n")
+    if metrics_path:
+        tmp_path = f"{metrics_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(render())
+        os.replace(tmp_path, metrics_path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # don't print a line for every scrape
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(flush_interval)
+        try:
+            flush()
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
+
+
+def _start_flusher():
+    """Start writing metrics in the background (and serving them) once there is something to write."""
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_periodically, name="metrics", daemon=True)
+        _flusher.start()
+        if metrics_port:
+            server = ThreadingHTTPServer(("", int(metrics_port)), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Serving metrics on port {metrics_port}")
+    atexit.register(flush)
@@ -1,18 +1,130 @@
 from reddit_lib import MetaComment, MetaPost
+import csv
+import os
+import re
+import threading
+import time
+import numpy as np
 
+# old, append-only files. Their text isn't escaped, so the loaders below parse them leniently
 posts_file = "ML/posts.csv"
 comments_file = "ML/comments.csv"
 
+# curation labels written by LabelStore, proper CSV with quoting
+posts_labels_file = "ML/post_labels.csv"
+comments_labels_file = "ML/comment_labels.csv"
+post_columns = ["post_id", "text", "accepted", "labelled_at"]
+comment_columns = ["post_id", "comment_id", "text", "accepted", "labelled_at"]
 
 
 def remove_non_ascii(text):
     return ''.join([i if ord(i) < 128 else ' ' for i in text])
 
+
+class LabelStore:
+    """
+    Buffers curation labels in memory and writes them in one go with flush(), which the curation code calls once per
+    decision instead of opening the files for every row.
+    """
+
+    def __init__(self, posts_path=posts_labels_file, comments_path=comments_labels_file):
+        self.posts_path = posts_path
+        self.comments_path = comments_path
+        self._posts = []
+        self._comments = []
+        self._lock = threading.Lock()
+
+    def add_post(self, post: MetaPost, accepted: bool):
+        with self._lock:
+            self._posts.append([post.post_id, post.text, accepted, time.time()])
+
+    def add_comment(self, comment: MetaComment, accepted: bool):
+        with self._lock:
+            self._comments.append([comment.post_id, comment.comment_id, comment.text, accepted, time.time()])
+
+    def flush(self):
+        """Append every buffered label to the label files."""
+        with self._lock:
+            posts, self._posts = self._posts, []
+            comments, self._comments = self._comments, []
+        _append_rows(self.posts_path, post_columns, posts)
+        _append_rows(self.comments_path, comment_columns, comments)
+
+
+def _append_rows(path, columns, rows):
+    if not rows:
+        return
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(columns)
+        writer.writerows(rows)
+
+
+label_store = LabelStore()
+
+
 def write_post_to_csv(post: MetaPost, accepted: bool):
-    with open(posts_file, 'a') as f:
-        f.write(f"{post.post_id},{remove_non_ascii(post.text)},{accepted}\n")
+    label_store.add_post(post, accepted)
 
 
 def write_comment_to_csv(comment: MetaComment, accepted: bool):
-    with open(comments_file, 'a') as f:
-        f.write(f"{comment.post_id},{comment.comment_id},{remove_non_ascii(comment.text)},{accepted}\n")
+    label_store.add_comment(comment, accepted)
+
+
+def _read_legacy_rows(path, id_columns):
+    """
+    Parse one of the old label files. Rows weren't escaped, so a row is everything up to the next ",True" or ",False"
+    at the end of a line, and the text is whatever sits between the id columns and that flag.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        f.readline()  # header
+        content = f.read()
+    rows = []
+    for match in re.finditer(r"(.*?),(True|False)(?:\r?\n|$)", content, flags=re.DOTALL):
+        fields = match.group(1).lstrip("\n").split(",", id_columns)
+        if len(fields) <= id_columns:
+            continue
+        rows.append(fields + [match.group(2) == "True", np.nan])
+    return rows
+
+
+def _read_rows(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # header
+        return [row[:-2] + [row[-2] == "True", float(row[-1])] for row in reader]
+
+
+def _to_columns(rows, columns):
+    """Turn rows into a dict of numpy arrays, one per column."""
+    data = {}
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows]
+        if column == "accepted":
+            data[column] = np.array(values, dtype=bool)
+        elif column == "labelled_at":
+            data[column] = np.array(values, dtype=np.float64)
+        else:
+            data[column] = np.array(values, dtype=object)
+    return data
+
+
+def load_post_labels():
+    """Load every post label, old and new, as columns: post_id, text, accepted, labelled_at (nan for old rows)."""
+    rows = _read_legacy_rows(posts_file, 1) + _read_rows(posts_labels_file)
+    return _to_columns(rows, post_columns)
+
+
+def load_comment_labels():
+    """
+    Load every comment label, old and new, as columns: post_id, comment_id, text, accepted, labelled_at
+    (nan for old rows).
+    """
+    rows = _read_legacy_rows(comments_file, 2) + _read_rows(comments_labels_file)
+    return _to_columns(rows, comment_columns)
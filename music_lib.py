@@ -0,0 +1,74 @@
+from moviepy.editor import AudioFileClip
+import json
+import os
+import random
+
+# The music directory gets an index.json sidecar with what add_music needs to know about each track, so a video
+# only has to decode the few seconds of music it actually uses.
+index_filename = "index.json"
+min_start_time = 30.0  # first 30 seconds are build up in most music
+
+
+def index_track(track_path):
+    """Scan a track once for its duration, sample rate, the gain that normalizes its peak to 1 and usable window."""
+    clip = AudioFileClip(track_path)
+    try:
+        peak = clip.max_volume()
+        duration = clip.duration
+        return {
+            "duration": duration,
+            "fps": clip.fps,
+            "gain": 1.0 / peak if peak > 0 else 1.0,
+            "start": min(min_start_time, duration),
+            "end": duration,
+        }
+    finally:
+        clip.close()
+
+
+def load_index(music_dir):
+    """
+    Load the music index, indexing new or changed mp3s and dropping deleted ones.
+    Tracks are matched on size and mtime, so only files that changed get scanned again.
+    """
+    index_path = os.path.join(music_dir, index_filename)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+
+    changed = False
+    current = {}
+    for file_name in sorted(os.listdir(music_dir)):
+        if not file_name.endswith(".mp3"):
+            continue
+        stat = os.stat(os.path.join(music_dir, file_name))
+        entry = index.get(file_name)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            print(f"Indexing music {file_name}")
+            entry = index_track(os.path.join(music_dir, file_name))
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            changed = True
+        current[file_name] = entry
+    if changed or current.keys() != index.keys():
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(current, f, indent=2)
+        os.replace(tmp_path, index_path)
+    return current
+
+
+def choose_segment(music_dir, duration):
+    """
+    Pick a random track long enough for the video and a random start inside its usable window.
+    :return: (file name, start time, gain)
+    """
+    index = load_index(music_dir)
+    long_enough = [name for name, entry in index.items() if entry["end"] - entry["start"] >= duration]
+    if not long_enough:
+        raise RuntimeError(f"No music in {music_dir} is long enough for a {duration:.1f}s video")
+    file_name = random.choice(long_enough)
+    entry = index[file_name]
+    start_time = random.uniform(entry["start"], entry["end"] - duration)
+    return file_name, start_time, entry["gain"]
@@ -1,7 +1,18 @@
+import asyncio
+import atexit
+import copy
+import pickle
+import inspect
 import time
+import queue
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
 from selenium import webdriver
 from selenium.common.exceptions import ElementNotVisibleException, ElementClickInterceptedException, \
-    ElementNotInteractableException
+    ElementNotInteractableException, WebDriverException, NoSuchElementException, NoSuchShadowRootException
+from selenium.webdriver.common.by import By
 from pyshadow.main import Shadow
 import asyncpraw as praw
 import logging
@@ -14,9 +25,12 @@ for logger_name in ("asyncpraw", "asyncprawcore"):
     logger.setLevel(logging.DEBUG)
     logger.addHandler(handler)
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 import os
 from dotenv import load_dotenv
+from cache_lib import DiskCache
+import metrics_lib
+from dedup_lib import produced_posts
 
 load_dotenv()
 
@@ -29,6 +43,8 @@ class MetaPost:
     nsfw: bool
     score: int
     path_to_image: Optional[str] = None
+    author: Optional[str] = None
+    image: Any = None  # the captured image in memory, PNG bytes from a screenshot or a BGR array from card_renderer
 
 
 @dataclass
@@ -38,6 +54,11 @@ class MetaComment:
     post_id: str
     comment_id: str
     path_to_image: Optional[str] = None
+    # rows to trim off the top of the screenshot, single comment thread pages have a header above the comment
+    image_top_trim: int = 75
+    author: Optional[str] = None
+    score: Optional[int] = None
+    image: Any = None  # the captured image in memory, PNG bytes from a screenshot or a BGR array from card_renderer
 
 
 class PostWithComments:
@@ -60,6 +81,16 @@ class CommentFailedToCapture(Exception):
     pass
 
 
+def _author_name(item):
+    """Name of the author of a submission or comment, None if the account was deleted."""
+    return item.author.name if item.author else None
+
+
+def _meta_post(post):
+    return MetaPost(text=post.title, post_id=post.id, nsfw=post.over_18, score=post.score, author=_author_name(post))
+
+
+@metrics_lib.traced("reddit.top_posts")
 async def get_top_n_posts(praw_inst, subreddit, n, time_filter="day"):
     """Get the IDs of the top n posts from a subreddit.
 
@@ -76,8 +107,9 @@ async def get_top_n_posts(praw_inst, subreddit, n, time_filter="day"):
     posts_found = 0
     sub = await praw_inst.subreddit(subreddit)
     async for post in sub.top(time_filter=time_filter):
-        if not post.over_18:
-            return_list.append(MetaPost(text=post.title, post_id=post.id, nsfw=post.over_18, score=post.score))
+        # and posts we already made a video of, or reposts of them
+        if not post.over_18 and not produced_posts.seen(post.id, post.title):
+            return_list.append(_meta_post(post))
             posts_found += 1
             if posts_found == n:
                 break
@@ -85,6 +117,7 @@ async def get_top_n_posts(praw_inst, subreddit, n, time_filter="day"):
     return return_list
 
 
+@metrics_lib.traced("reddit.search")
 async def search_subreddit(praw_inst, subreddit, query, n=5):
     """Search a subreddit for a query.
 
@@ -100,23 +133,43 @@ async def search_subreddit(praw_inst, subreddit, query, n=5):
     return_list = []
     posts_found = 0
     sub = await praw_inst.subreddit(subreddit)
-    async for post in sub.search(query, limit=n, sort="top"):
-        if not post.over_18:
-            return_list.append(MetaPost(text=post.title, post_id=post.id, nsfw=post.over_18, score=post.score))
+    # no limit, skipped posts shouldn't leave us short, the listing is paged lazily until we have n
+    async for post in sub.search(query, limit=None, sort="top"):
+        if not post.over_18 and not produced_posts.seen(post.id, post.title):
+            return_list.append(_meta_post(post))
             posts_found += 1
             if posts_found == n:
                 break
     print(f"Found {posts_found} posts")
     return return_list
 
-def get_posts(praw_inst, ids):
-    return_list = []
-    for id in ids:
-        post = praw_inst.submission(id=id)
-        return_list.append(MetaPost(text=post.title, post_id=post.id, nsfw=post.over_18))
-    return return_list
 
+# most things reddit's /api/info endpoint will look up in one request
+info_batch_size = 100
 
+
+@metrics_lib.traced("reddit.info")
+async def get_posts(praw_inst, ids):
+    """Look up posts by ID, in batched info requests rather than one request per post.
+
+    Args:
+        ids (list): The IDs of the posts to get.
+
+    Returns:
+        list: A list of MetaPosts in the same order as ids. IDs that don't exist (anymore) are left out.
+    """
+    found = {}
+    for start in range(0, len(ids), info_batch_size):
+        fullnames = [f"t3_{post_id}" for post_id in ids[start:start + info_batch_size]]
+        posts = praw_inst.info(fullnames=fullnames)
+        if inspect.isawaitable(posts):  # a coroutine in asyncpraw, that gives the listing generator
+            posts = await posts
+        async for post in posts:
+            found[post.id] = _meta_post(post)
+    return [found[post_id] for post_id in ids if post_id in found]
+
+
+@metrics_lib.traced("reddit.comments")
 def get_top_n_comments_from_post(praw_inst, post_id, n):
     """Get the top n comments from a post.
 
@@ -129,10 +182,12 @@ def get_top_n_comments_from_post(praw_inst, post_id, n):
     """
     post = praw_inst.submission(id=post_id)
     post.comments.replace_more(limit=0)
-    return [MetaComment(text=comment.body, post_id=comment.link_id, comment_id=comment.id) for comment in
+    return [MetaComment(text=comment.body, post_id=comment.link_id, comment_id=comment.id, author=_author_name(comment),
+                        score=comment.score) for comment in
             post.comments[:n]]
 
 
+@metrics_lib.traced("reddit.comments")
 async def async_get_top_n_comments_from_post(praw_inst, post_id, n):
     """Get the top n comments from a post.
 
@@ -147,69 +202,340 @@ async def async_get_top_n_comments_from_post(praw_inst, post_id, n):
     post = await praw_inst.submission(post_id)
     await post.comments.replace_more(limit=0)
     comments = post.comments._comments[:n]
-    return [MetaComment(text=comment.body, post_id=comment.link_id, comment_id=comment.id) for comment in
+    return [MetaComment(text=comment.body, post_id=comment.link_id, comment_id=comment.id, author=_author_name(comment),
+                        score=comment.score) for comment in
             comments]
 
 
-def capture_reddit_mobile_post_card(post_id, image_path, nsfw=False):
+MOBILE_EMULATION = {
+    "deviceMetrics": {"width": 400, "height": 700, "pixelRatio": 3.0},
+    "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 10_3 like Mac OS X) AppleWebKit/602.1.50 (KHTML, like Gecko) CriOS/56.0.2924.75 Mobile Safari/535.19"
+}
+
+PAGE_ZOOM = "120%"
+
+# drivers that have already clicked through Reddit's "continue" modal, so later page loads don't wait for it
+_modal_dismissed_drivers = weakref.WeakSet()
+
+
+class ChromeDriverPool:
+    """
+    A pool of warm Chrome sessions. Capture functions borrow a driver instead of cold starting a new browser for
+    every screenshot. Drivers are health-checked when borrowed and recycled after max_uses or if they crash.
+    """
+
+    def __init__(self, size=2, max_uses=25, mobile=True):
+        self.size = size
+        self.max_uses = max_uses
+        self.mobile = mobile
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _new_driver(self):
+        if self.mobile:
+            options = webdriver.ChromeOptions()
+            options.add_experimental_option("mobileEmulation", MOBILE_EMULATION)
+            driver = webdriver.Chrome(options=options)
+        else:
+            driver = webdriver.Chrome()
+        with self._lock:
+            self._uses[driver] = 0
+        return driver
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def acquire(self, timeout=None):
+        """Borrow a driver, blocking until one of the pool's slots is free."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a Chrome driver from the pool")
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    return self._new_driver()
+                except Exception:
+                    self._slots.release()
+                    raise
+            if self._is_healthy(driver):
+                return driver
+            print("Pooled Chrome driver is unresponsive, replacing it")
+            metrics_lib.increment("stage_failures_total", stage="chrome_driver")
+            self._discard(driver)
+
+    def release(self, driver, broken=False):
+        """Give a driver back to the pool. Broken or worn out drivers are quit instead of reused."""
+        with self._lock:
+            uses = self._uses.get(driver, 0) + 1
+            self._uses[driver] = uses
+        if broken or uses >= self.max_uses:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+        self._slots.release()
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        driver = self.acquire(timeout=timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = not self._is_healthy(driver)
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self):
+        """Quit every idle driver in the pool."""
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+
+driver_pool_size = int(os.environ.get("driver_pool_size", 2))
+driver_max_uses = int(os.environ.get("driver_max_uses", 25))
+_driver_pools = {}
+_driver_pools_lock = threading.Lock()
+
+
+def get_driver_pool(nsfw=False):
+    """Get the shared driver pool, nsfw posts use a desktop (non mobile emulated) browser."""
+    with _driver_pools_lock:
+        if nsfw not in _driver_pools:
+            _driver_pools[nsfw] = ChromeDriverPool(size=driver_pool_size, max_uses=driver_max_uses, mobile=not nsfw)
+        return _driver_pools[nsfw]
+
+
+def close_driver_pools():
+    with _driver_pools_lock:
+        for pool in _driver_pools.values():
+            pool.close()
+        _driver_pools.clear()
+
+
+atexit.register(close_driver_pools)
+
+
+screenshot_cache = DiskCache(os.environ.get("screenshot_cache_dir", os.path.join("cache", "screenshots")),
+                             max_bytes=int(float(os.environ.get("screenshot_cache_max_mb", 500)) * 1024 * 1024),
+                             ttl=float(os.environ.get("screenshot_cache_ttl", 7 * 24 * 60 * 60)),
+                             suffix=".png", name="screenshots")
+
+
+def screenshot_cache_key(post_id, comment_id=None, nsfw=False, crop="post_card"):
+    """Key a screenshot by what it shows and every browser setting that changes how it looks."""
+    emulation = None if nsfw else MOBILE_EMULATION
+    return DiskCache.make_key(post_id, comment_id, emulation, PAGE_ZOOM, crop)
+
+
+continue_button_xpath = '//*[@id="secondary-button"]/span/span'
+
+
+def open_reddit_page(driver, url):
+    """
+    Navigate a driver to a Reddit url and click through the "continue" modal.
+    Warm drivers have usually dismissed the modal already, so they only look for it once without waiting.
+    Returns the pyshadow Shadow for the page.
+    """
+    driver.execute_script(f"document.body.style.zoom='{PAGE_ZOOM}'")
+    driver.get(url)
+    shadow = Shadow(driver)
+    if driver in _modal_dismissed_drivers:
+        # a new Shadow has no explicit wait, so this looks through the shadow DOM once
+        try:
+            shadow.find_element_by_xpath(continue_button_xpath).click()
+        except (ElementNotVisibleException, ElementClickInterceptedException, ElementNotInteractableException):
+            pass
+    else:
+        shadow.set_explicit_wait(10, 2)
+        continue_button = shadow.find_element_by_xpath(continue_button_xpath)
+        continue_button.click()
+        _modal_dismissed_drivers.add(driver)
+    shadow.set_explicit_wait(10, 2)
+    return shadow
+
+
+def _save_image(image_path, png):
+    if image_path is not None:
+        with open(image_path, "wb") as f:
+            f.write(png)
+
+
+class RedditCache:
+    """
+    TTL cache over Reddit listings, searches and comment trees, so repeat commands during a curation session don't go
+    back to the API. Entries live in memory and, if a path is given, are also pickled to disk to survive restarts.
+    Callers get copies, since the pipeline mutates the MetaPosts/MetaComments it is given.
+    """
+
+    def __init__(self, ttls, path=None):
+        self.ttls = ttls  # seconds per kind of entry
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._pending = {}  # fetches in flight, so a prefetch and a command asking for the same thing share one
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    self._entries = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError) as e:
+                print(f"Ignoring unreadable Reddit cache {path}: {e}")
+
+    def get(self, kind, key):
+        entry = self._entries.get((kind, key))
+        if entry is None or time.time() - entry[0] > self.ttls[kind]:
+            self.misses += 1
+            metrics_lib.increment("cache_misses_total", cache=f"reddit_{kind}")
+            return None
+        self.hits += 1
+        metrics_lib.increment("cache_hits_total", cache=f"reddit_{kind}")
+        return copy.deepcopy(entry[1])
+
+    def put(self, kind, key, value):
+        self._entries[(kind, key)] = (time.time(), copy.deepcopy(value))
+        self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        now = time.time()
+        self._entries = {entry_key: entry for entry_key, entry in self._entries.items()
+                         if now - entry[0] <= self.ttls[entry_key[0]]}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    async def fetch(self, kind, key, fetcher, refresh=False):
+        """
+        Return the cached value for key, or await fetcher() and cache that. refresh skips the cached value.
+        If the same fetch is already in flight this waits for it instead of starting another.
+        """
+        if not refresh:
+            value = self.get(kind, key)
+            if value is not None:
+                return value
+        task = self._pending.get((kind, key))
+        if task is None or refresh:
+            task = asyncio.ensure_future(fetcher())
+            self._pending[(kind, key)] = task
+
+            def done(finished_task):
+                if self._pending.get((kind, key)) is finished_task:
+                    del self._pending[(kind, key)]
+                if not finished_task.cancelled() and finished_task.exception() is None:
+                    self.put(kind, key, finished_task.result())
+
+            task.add_done_callback(done)
+        # shielded so a cancelled caller (e.g. a stale prefetch) doesn't cancel the fetch for everyone else
+        return copy.deepcopy(await asyncio.shield(task))
+
+
+reddit_cache = RedditCache(
+    ttls={"listing": float(os.environ.get("reddit_listing_ttl", 10 * 60)),
+          "search": float(os.environ.get("reddit_search_ttl", 30 * 60)),
+          "comments": float(os.environ.get("reddit_comments_ttl", 5 * 60))},
+    path=os.environ.get("reddit_cache_path"))
+
+
+async def cached_get_top_n_posts(praw_inst, subreddit, n, time_filter="day", refresh=False):
+    """get_top_n_posts through reddit_cache, minus posts produced since the listing was cached."""
+    posts = await reddit_cache.fetch("listing", (subreddit.lower(), time_filter, n),
+                                     lambda: get_top_n_posts(praw_inst, subreddit, n, time_filter=time_filter),
+                                     refresh=refresh)
+    return produced_posts.filter(posts)
+
+
+async def cached_search_subreddit(praw_inst, subreddit, query, n=5, refresh=False):
+    """search_subreddit through reddit_cache, minus posts produced since the search was cached."""
+    posts = await reddit_cache.fetch("search", (subreddit.lower(), query, n),
+                                     lambda: search_subreddit(praw_inst, subreddit, query, n=n), refresh=refresh)
+    return produced_posts.filter(posts)
+
+
+async def cached_get_top_n_comments_from_post(praw_inst, post_id, n, refresh=False):
+    """async_get_top_n_comments_from_post through reddit_cache."""
+    return await reddit_cache.fetch("comments", (post_id, n),
+                                    lambda: async_get_top_n_comments_from_post(praw_inst, post_id, n),
+                                    refresh=refresh)
+
+
+def capture_reddit_mobile_post_card(post_id, image_path=None, nsfw=False, driver=None):
     """Capture a screenshot of the mobile preview card for a Reddit post.
 
     Args:
         post_id (str): The ID of the Reddit post to capture.
-        image_path (str): The path to save the image to.
-    Returns none
+        image_path (str): The path to save the image to, or None to only keep it in memory.
+        driver: A driver borrowed from the pool, if None one is borrowed just for this capture.
+    Returns:
+        bytes: The screenshot as a PNG.
     """
-    # Set up the Chrome driver with mobile device emulation
-    if nsfw:
-        driver = webdriver.Chrome()
-    else:
-        mobile_emulation = {
-            "deviceMetrics": {"width": 400, "height": 700, "pixelRatio": 3.0},
-            "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 10_3 like Mac OS X) AppleWebKit/602.1.50 (KHTML, like Gecko) CriOS/56.0.2924.75 Mobile Safari/535.19"
-        }
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option("mobileEmulation", mobile_emulation)
-        driver = webdriver.Chrome(options=options)
-    driver.execute_script("document.body.style.zoom='120%'")
+    cache_key = screenshot_cache_key(post_id, nsfw=nsfw)
+    if driver is None:
+        png = screenshot_cache.get_bytes(cache_key)
+        if png is not None:
+            _save_image(image_path, png)
+            return png
+        # the span is only opened here, so the call below with the borrowed driver isn't counted twice
+        with metrics_lib.span("capture.post", post_id=post_id), get_driver_pool(nsfw).borrow() as driver:
+            return capture_reddit_mobile_post_card(post_id, image_path, nsfw=nsfw, driver=driver)
 
     # Navigate to the post and wait for the preview card to load
-    driver.get(f"https://www.reddit.com/{post_id}")
-    shadow = Shadow(driver)
-    shadow.set_explicit_wait(10, 2)
-    continue_button = shadow.find_element_by_xpath('//*[@id="secondary-button"]/span/span')
-    continue_button.click()
+    shadow = open_reddit_page(driver, f"https://www.reddit.com/{post_id}")
 
     preview_card_element = shadow.find_element_by_xpath(f'//*[@id="t3_{post_id}"]')
-    with open(image_path, "wb") as f:
-        f.write(preview_card_element.screenshot_as_png)
-    driver.quit()
+    png = preview_card_element.screenshot_as_png
+    _save_image(image_path, png)
+    screenshot_cache.put_bytes(cache_key, png)
+    return png
 
 
-def capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, retry=False):
+def capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, retry=False, driver=None):
     """Capture a screenshot of the mobile preview card for a Reddit post's comment.
 
     Args:
         post_id (str): The ID of the Reddit post to capture.
         comment_id (str): The ID of the comment to capture.
-        image_path (str): The path to save the image to.
+        image_path (str): The path to save the image to, or None to only keep it in memory.
         subreddit (str): The subreddit the post is in (to form the URL)
+        driver: A driver borrowed from the pool, if None one is borrowed just for this capture.
+    Returns:
+        bytes: The screenshot as a PNG.
     """
-    # Set up the Chrome driver with mobile device emulation
-    mobile_emulation = {
-        "deviceMetrics": {"width": 400, "height": 700, "pixelRatio": 3.0},
-        "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 10_3 like Mac OS X) AppleWebKit/602.1.50 (KHTML, like Gecko) CriOS/56.0.2924.75 Mobile Safari/535.19"
-    }
-    options = webdriver.ChromeOptions()
-    options.add_experimental_option("mobileEmulation", mobile_emulation)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("document.body.style.zoom='120%'")
+    cache_key = screenshot_cache_key(post_id, comment_id, crop="single_comment_thread")
+    if driver is None:
+        png = screenshot_cache.get_bytes(cache_key)
+        if png is not None:
+            _save_image(image_path, png)
+            return png
+        with metrics_lib.span("capture.comment", post_id=post_id, comment_id=comment_id), \
+                get_driver_pool().borrow() as driver:
+            return capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, retry=retry,
+                                                 driver=driver)
 
     # Navigate to the post and wait for the preview card to load
-    driver.get(f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/comment/{comment_id}")
-    shadow = Shadow(driver)
-    shadow.set_explicit_wait(10, 2)
-    continue_button = shadow.find_element_by_xpath('//*[@id="secondary-button"]/span/span')
-    continue_button.click()
+    shadow = open_reddit_page(driver, f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/comment/{comment_id}")
 
     # close the comments thread so the screenshot only captures the first comment
     try:
@@ -222,13 +548,79 @@ def capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, re
     try:
         comment_element = shadow.find_element(f'[thingid="t1_{comment_id}"]')
 
-        with open(image_path, "wb") as f:
-            f.write(comment_element.screenshot_as_png)
-        driver.quit()
+        png = comment_element.screenshot_as_png
+        _save_image(image_path, png)
+        screenshot_cache.put_bytes(cache_key, png)
+        return png
     except ElementNotVisibleException as e:
         if retry:
             raise e
-        capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, retry=True)
+        metrics_lib.increment("retries_total", stage="capture.comment")
+        return capture_reddit_comment_mobile(post_id, comment_id, image_path, subreddit, retry=True, driver=driver)
+
+
+def _fold_comment_replies(comment_element):
+    """Close the replies under a comment element so its screenshot only contains the comment itself."""
+    try:
+        comment_element.shadow_root.find_element(By.CSS_SELECTOR, '[id="comment-fold-button"]').click()
+    except (NoSuchShadowRootException, NoSuchElementException):  # some comments might not have replies, ignore
+        pass
+    except (ElementClickInterceptedException, ElementNotInteractableException):
+        print("Warning, comment is probably longer than the screen")
+
+
+def capture_reddit_comments_mobile(post_id, comment_ids, subreddit, driver=None, cancelled=None):
+    """Capture screenshots of many comments from a single load of the post's comment thread.
+
+    Args:
+        post_id (str): The ID of the Reddit post the comments are on.
+        comment_ids (list): IDs of the comments to capture.
+        subreddit (str): The subreddit the post is in (to form the URL)
+        driver: A driver borrowed from the pool, if None one is borrowed just for this capture.
+        cancelled (threading.Event): If given, stop capturing once it is set, e.g. for a prefetch nobody needs now.
+    Returns:
+        dict: Maps comment IDs to their screenshot as a PNG. Comments that weren't on the thread page are left out,
+        capture these with capture_reddit_comment_mobile.
+    """
+    if driver is None:
+        pngs = {}
+        to_capture = []
+        for comment_id in comment_ids:
+            png = screenshot_cache.get_bytes(screenshot_cache_key(post_id, comment_id, crop="thread"))
+            if png is not None:
+                pngs[comment_id] = png
+            elif not screenshot_cache.contains(screenshot_cache_key(post_id, comment_id,
+                                                                    crop="single_comment_thread")):
+                # if it was missing from the thread page last time, the fallback capture will hit the cache
+                to_capture.append(comment_id)
+        if not to_capture:
+            return pngs
+        with metrics_lib.span("capture.thread", post_id=post_id, comments=len(to_capture)), \
+                get_driver_pool().borrow() as driver:
+            pngs.update(capture_reddit_comments_mobile(post_id, to_capture, subreddit, driver=driver,
+                                                       cancelled=cancelled))
+            return pngs
+
+    shadow = open_reddit_page(driver, f"https://www.reddit.com/r/{subreddit}/comments/{post_id}")
+
+    pngs = {}
+    for comment_id in comment_ids:
+        if cancelled is not None and cancelled.is_set():
+            break
+        try:
+            comment_element = shadow.find_element(f'[thingid="t1_{comment_id}"]')
+        except ElementNotVisibleException:  # not loaded on the thread page, e.g. collapsed or too far down
+            continue
+        # only wait for the first comment, the rest of the thread has loaded by then
+        shadow.set_explicit_wait(2, 1)
+        _fold_comment_replies(comment_element)
+        try:
+            png = comment_element.screenshot_as_png
+        except WebDriverException:
+            continue
+        pngs[comment_id] = png
+        screenshot_cache.put_bytes(screenshot_cache_key(post_id, comment_id, crop="thread"), png)
+    return pngs
 
 
 # Sign in to Reddit using API Key
@@ -244,6 +636,206 @@ def create_reddit():
 reddit = create_reddit()
 
 
+capture_workers = int(os.environ.get("capture_workers", driver_pool_size))
+capture_timeout = float(os.environ.get("capture_timeout", 60))
+batch_comment_capture = os.environ.get("batch_comment_capture", "True") == "True"
+# "selenium" screenshots live Reddit, "render" draws the cards locally from the post/comment text with card_renderer
+capture_backend = os.environ.get("capture_backend", "selenium")
+# captured images are kept in memory on MetaPost.image/MetaComment.image, only written to images/ for debugging
+persist_images = os.environ.get("persist_images", "False") == "True"
+
+
+def _post_image_path(meta_post: MetaPost, images_dir):
+    """Where to save the post's image, None unless persist_images is on."""
+    if not persist_images:
+        return None
+    return os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}.png")
+
+
+def _comment_image_path(meta_post: MetaPost, meta_comment: MetaComment, images_dir):
+    """Where to save the comment's image, None unless persist_images is on."""
+    if not persist_images:
+        return None
+    return os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}_{meta_comment.comment_id}.png")
+
+
+def _capture_post(meta_post: MetaPost, images_dir):
+    meta_post.path_to_image = _post_image_path(meta_post, images_dir)
+    return capture_reddit_mobile_post_card(meta_post.post_id, meta_post.path_to_image, nsfw=meta_post.nsfw)
+
+
+def _capture_comment(meta_post: MetaPost, meta_comment: MetaComment, subreddit, images_dir):
+    meta_comment.path_to_image = _comment_image_path(meta_post, meta_comment, images_dir)
+    return capture_reddit_comment_mobile(meta_post.post_id, meta_comment.comment_id, meta_comment.path_to_image,
+                                         subreddit)
+
+
+def _capture_comments_batch(meta_post: MetaPost, comment_futures, subreddit, images_dir):
+    """
+    Capture all of a post's comments from one page load and resolve each comment's future.
+    Comments that aren't on the thread page fall back to their own single comment thread page.
+    """
+    try:
+        pngs = capture_reddit_comments_mobile(meta_post.post_id,
+                                              [meta_comment.comment_id for meta_comment, _ in comment_futures],
+                                              subreddit)
+    except Exception as e:
+        print(f"Failed to capture comments of {meta_post.post_id} from one page, capturing them one by one: {e!r}")
+        metrics_lib.increment("retries_total", stage="capture.thread")
+        pngs = {}
+
+    for meta_comment, future in comment_futures:
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            if meta_comment.comment_id in pngs:
+                # thread page screenshots don't have the single comment thread header
+                meta_comment.image_top_trim = 0
+                meta_comment.path_to_image = _comment_image_path(meta_post, meta_comment, images_dir)
+                _save_image(meta_comment.path_to_image, pngs[meta_comment.comment_id])
+                future.set_result(pngs[meta_comment.comment_id])
+            else:
+                future.set_result(_capture_comment(meta_post, meta_comment, subreddit, images_dir))
+        except Exception as e:
+            future.set_exception(e)
+
+
+@metrics_lib.traced("capture.render_post")
+def _render_post(meta_post: MetaPost, subreddit, images_dir):
+    import card_renderer
+    meta_post.path_to_image = _post_image_path(meta_post, images_dir)
+    return card_renderer.render_post_card(meta_post, meta_post.path_to_image, subreddit)
+
+
+@metrics_lib.traced("capture.render_comment")
+def _render_comment(meta_post: MetaPost, meta_comment: MetaComment, images_dir):
+    import card_renderer
+    meta_comment.path_to_image = _comment_image_path(meta_post, meta_comment, images_dir)
+    # rendered cards don't have the single comment thread header
+    meta_comment.image_top_trim = 0
+    return card_renderer.render_comment_card(meta_comment, meta_comment.path_to_image)
+
+
+class _CaptureClock:
+    """When a worker picked up a capture, so its timeout doesn't count the time it spent queued behind others."""
+
+    def __init__(self):
+        self._started = threading.Event()
+        self._start_time = None
+
+    def start(self):
+        self._start_time = time.monotonic()
+        self._started.set()
+
+    def result(self, future):
+        """Wait for the capture's result, giving up capture_timeout seconds after a worker started it."""
+        # a capture that never starts is cancelled when an earlier one times out, so this doesn't wait forever
+        while not self._started.wait(timeout=1):
+            if future.done():
+                return future.result()
+        return future.result(timeout=max(0.0, self._start_time + capture_timeout - time.monotonic()))
+
+
+def _submit_timed(executor, clock, fn, *args):
+    """Submit fn to the executor, starting clock when a worker picks it up."""
+
+    def run():
+        clock.start()
+        return fn(*args)
+
+    return executor.submit(run)
+
+
+def submit_post_with_comments_capture(executor, meta_post: MetaPost, comments, subreddit, images_dir):
+    """
+    Queue the post card and every comment of a post for capture on the executor.
+    Returns the post's (future, clock) and a list of (MetaComment, future, clock) for
+    collect_post_with_comments_capture. Each clock starts when a worker picks the capture up.
+    """
+    if capture_backend == "render":
+        post_clock = _CaptureClock()
+        post_capture = (_submit_timed(executor, post_clock, _render_post, meta_post, subreddit, images_dir), post_clock)
+        comment_captures = []
+        for meta_comment in comments:
+            clock = _CaptureClock()
+            future = _submit_timed(executor, clock, _render_comment, meta_post, meta_comment, images_dir)
+            comment_captures.append((meta_comment, future, clock))
+        return post_capture, comment_captures
+
+    post_clock = _CaptureClock()
+    post_capture = (_submit_timed(executor, post_clock, _capture_post, meta_post, images_dir), post_clock)
+    if batch_comment_capture:
+        # the comments are all captured by one task, so they share its clock
+        batch_clock = _CaptureClock()
+        comment_futures = [(meta_comment, Future()) for meta_comment in comments]
+        batch_future = _submit_timed(executor, batch_clock, _capture_comments_batch, meta_post, comment_futures,
+                                     subreddit, images_dir)
+        # if the batch is cancelled before it starts nothing would resolve the comment futures
+        batch_future.add_done_callback(
+            lambda f: [future.cancel() for _, future in comment_futures] if f.cancelled() else None)
+        comment_captures = [(meta_comment, future, batch_clock) for meta_comment, future in comment_futures]
+    else:
+        comment_captures = []
+        for meta_comment in comments:
+            clock = _CaptureClock()
+            future = _submit_timed(executor, clock, _capture_comment, meta_post, meta_comment, subreddit, images_dir)
+            comment_captures.append((meta_comment, future, clock))
+    return post_capture, comment_captures
+
+
+def collect_post_with_comments_capture(meta_post: MetaPost, post_capture, comment_captures, subreddit):
+    """
+    Wait for the captures queued by submit_post_with_comments_capture. Each one times out capture_timeout seconds
+    after a worker started it, however long it was queued.
+    Returns a PostWithComments, or None if no comments were captured.
+    """
+    post_future, post_clock = post_capture
+    try:
+        meta_post.image = post_clock.result(post_future)
+    except Exception as e:
+        for _, future, _ in comment_captures:
+            future.cancel()
+        print(f"Failed to capture post {meta_post.post_id} with error: {e!r}")
+        raise PostFailedToCapture(e)
+
+    successful_meta_comments = []
+    for meta_comment, future, clock in comment_captures:
+        try:
+            meta_comment.image = clock.result(future)
+            successful_meta_comments.append(meta_comment)
+        except Exception as e:
+            for _, other_future, _ in comment_captures:
+                other_future.cancel()
+            print(f"Failed to capture comment {meta_comment.comment_id} with error: {e!r}")
+            raise CommentFailedToCapture(e)
+    if len(successful_meta_comments) == 0:
+        print("Failed to capture any comments for this post. Skipping...")
+        return None
+    # posts AND their comments succeeded, so make a PostWithComments object
+    return PostWithComments(meta_post, successful_meta_comments, subreddit)
+
+
+@contextmanager
+def _capture_executor():
+    """
+    A thread pool for captures. If waiting on the captures fails, e.g. one timed out, the pool is shut down without
+    waiting for the hung capture and the captures that haven't started are cancelled.
+    """
+    executor = ThreadPoolExecutor(max_workers=capture_workers)
+    try:
+        yield executor
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+
+def _run(coroutine):
+    """Run an asyncpraw call from synchronous code."""
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+@metrics_lib.traced("reddit.posts_with_comments")
 def get_n_posts_with_m_comments(subreddit, n, m, prime=None):
     """
     Get the top n posts from a subreddit, and the top m comments from each post.
@@ -256,49 +848,38 @@ def get_n_posts_with_m_comments(subreddit, n, m, prime=None):
     if prime is None:
 
         print(f"1. Getting top {n} posts from r/{subreddit} with {m} comments each")
-        posts = get_top_n_posts(reddit, subreddit, n)
+        posts = _run(get_top_n_posts(reddit, subreddit, n))
     else:
         print(f"Ignoring n, using ids from prime")
-        posts = get_posts(reddit, prime)
-
-    successful_meta_posts_with_comments = []
-    for index, meta_post in enumerate(posts):
-        print(f"Post {index + 1}: {meta_post.text}")
-        images_dir = os.path.join(os.getcwd(), "images")
-        image_path = os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}.png")
-        meta_post.path_to_image = image_path
-        try:
-            capture_reddit_mobile_post_card(meta_post.post_id, image_path, nsfw=meta_post.nsfw)
-        except Exception as e:
-            print(f"Failed to capture post {meta_post.post_id} with error: {e}")
-            raise PostFailedToCapture(e)
+        posts = _run(get_posts(reddit, prime))
 
-        comments = get_top_n_comments_from_post(reddit, meta_post.post_id, m)
-        meta_comment: MetaComment
-        print("\t Comments:")
-
-        successful_meta_comments = []
-        for com_index, meta_comment in enumerate(comments):
-            print(f"\t {com_index + 1}: {meta_comment.text}")
-            image_path = os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}_{meta_comment.comment_id}.png")
-            try:
-                capture_reddit_comment_mobile(meta_post.post_id, meta_comment.comment_id, image_path, subreddit)
-                meta_comment.path_to_image = image_path
-                successful_meta_comments.append(meta_comment)
-            except Exception as e:
-                print(f"Failed to capture comment {meta_comment.comment_id} with error: {e}")
-                raise CommentFailedToCapture(e)
-        if len(successful_meta_comments) == 0:
-            print("Failed to capture any comments for this post. Skipping...")
-        else:
-            # posts AND their comments succeeded, so make a PostWithComments object
-            successful_meta_posts_with_comments.append(PostWithComments(meta_post, successful_meta_comments, subreddit))
+    images_dir = os.path.join(os.getcwd(), "images")
+    pending = []
+    with _capture_executor() as executor:
+        # fan out the captures for every post in the batch before waiting on any of them
+        for index, meta_post in enumerate(posts):
+            print(f"Post {index + 1}: {meta_post.text}")
+            if persist_images:
+                os.makedirs(os.path.join(images_dir, f"{meta_post.post_id}"), exist_ok=True)
+            comments = _run(async_get_top_n_comments_from_post(reddit, meta_post.post_id, m))
+            print("\t Comments:")
+            for com_index, meta_comment in enumerate(comments):
+                print(f"\t {com_index + 1}: {meta_comment.text}")
+            pending.append(submit_post_with_comments_capture(executor, meta_post, comments, subreddit, images_dir))
+
+        successful_meta_posts_with_comments = []
+        for meta_post, (post_capture, comment_captures) in zip(posts, pending):
+            post_with_comments = collect_post_with_comments_capture(meta_post, post_capture, comment_captures,
+                                                                    subreddit)
+            if post_with_comments is not None:
+                successful_meta_posts_with_comments.append(post_with_comments)
     if len(successful_meta_posts_with_comments) == 0:
         raise Exception(f"Failed to capture any posts or comments.")
     print(f"Successfully captured {len(successful_meta_posts_with_comments)} posts with comments.")
     return successful_meta_posts_with_comments
 
 
+@metrics_lib.traced("capture.post_with_comments")
 def get_images_for_post_with_comments(post_with_comments: PostWithComments):
     """
     Given a PostWithComments object, download the images for the post and its comments
@@ -308,36 +889,15 @@ def get_images_for_post_with_comments(post_with_comments: PostWithComments):
     post_dir = os.path.join(images_dir, f"{meta_post.post_id}")
     if os.path.exists(post_dir):
         shutil.rmtree(post_dir)
-    os.mkdir(os.path.join(images_dir, f"{meta_post.post_id}"))
-    image_path = os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}.png")
-    print(f"Fetching image for post")
-    try:
-        capture_reddit_mobile_post_card(meta_post.post_id, image_path, nsfw=meta_post.nsfw)
-        meta_post.path_to_image = image_path
-    except Exception as e:
-        print(f"Failed to capture post {meta_post.post_id} with error: {e}")
-        raise PostFailedToCapture(e)
-
-    comments = post_with_comments.comments
-    meta_comment: MetaComment
-    print("\t Fetching images for comments:")
-
-    successful_meta_comments = []
-    for com_index, meta_comment in enumerate(comments):
-        print(f"\t {com_index + 1}: {meta_comment.text}")
-        image_path = os.path.join(images_dir, f"{meta_post.post_id}", f"{meta_post.post_id}_{meta_comment.comment_id}.png")
-        try:
-            capture_reddit_comment_mobile(meta_post.post_id, meta_comment.comment_id, image_path, post_with_comments.subreddit)
-            meta_comment.path_to_image = image_path
-            successful_meta_comments.append(meta_comment)
-        except Exception as e:
-            print(f"Failed to capture comment {meta_comment.comment_id} with error: {e}")
-            raise CommentFailedToCapture(e)
-    if len(successful_meta_comments) == 0:
-        print("Failed to capture any comments for this post. Skipping...")
-    else:
-        # posts AND their comments succeeded, so make a PostWithComments object
-        return PostWithComments(meta_post, successful_meta_comments, post_with_comments.subreddit)
+    if persist_images:
+        os.makedirs(post_dir)
+    print(f"Fetching images for post and comments")
+    with _capture_executor() as executor:
+        post_capture, comment_captures = submit_post_with_comments_capture(executor, meta_post,
+                                                                           post_with_comments.comments,
+                                                                           post_with_comments.subreddit, images_dir)
+        return collect_post_with_comments_capture(meta_post, post_capture, comment_captures,
+                                                  post_with_comments.subreddit)
 
 
 if __name__ == '__main__':
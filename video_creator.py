@@ -1,22 +1,29 @@
-from reddit_lib import PostWithComments
-from google.cloud import texttospeech
+from reddit_lib import PostWithComments, persist_images
+from dedup_lib import produced_posts
 import os
 import numpy as np
 from moviepy.editor import (
-    VideoFileClip,
     ImageClip,
     concatenate_videoclips,
     CompositeVideoClip,
     CompositeAudioClip,
     AudioFileClip
 )
+from moviepy.audio.AudioClip import AudioArrayClip
 import asyncio
 import cv2
 import youtube_lib
-import random
-from moviepy.audio.fx import audio_normalize, audio_fadein, audio_fadeout, volumex
+from moviepy.audio.fx import audio_fadein, audio_fadeout, volumex
 from pydub import AudioSegment
+from cache_lib import DiskCache
+import metrics_lib
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import tts_lib
+import music_lib
 import re
+import subprocess
+from imageio_ffmpeg import get_ffmpeg_exe
 
 
 # voices: https://cloud.google.com/text-to-speech/docs/voices
@@ -58,50 +65,66 @@ def preprocess_text(text):
     return new_text
 
 
+tts_language_code = "en-US"
+tts_voice_name = "en-US-Studio-M"
+tts_speaking_rate = 1.2
+tts_effects_profile = ['handset-class-device']
+tts_workers = int(os.environ.get("tts_workers", 8))
+
+# "google" for the real voice, "local" for offline runs and tests
+tts_engine = tts_lib.create_engine(os.environ.get("tts_backend", "google"), tts_language_code, tts_voice_name,
+                                   tts_speaking_rate, tts_effects_profile)
+
+tts_cache = DiskCache(os.environ.get("tts_cache_dir", os.path.join("cache", "tts")),
+                      max_bytes=int(float(os.environ.get("tts_cache_max_mb", 200)) * 1024 * 1024),
+                      suffix=".mp3", name="tts")
+
+
+def tts_cache_key(text):
+    """Key a clip by its text and every voice setting that changes how it sounds."""
+    return DiskCache.make_key(text, tts_engine.name, tts_language_code, tts_voice_name, tts_speaking_rate, "MP3",
+                              tts_effects_profile)
+
+
+@metrics_lib.traced("video.tts_clip")
 def tts(text, output_file):
-    """Use GCP text to speech to make an mp3 file from text."""
-    client = texttospeech.TextToSpeechClient()
-    # if "?" in text:
-    #     text = text_to_ssml_break_after_questions(text)
-    #     synthesis_input = texttospeech.SynthesisInput(ssml=text)
-    # else:
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code="en-US", name="en-US-Studio-M")
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3, speaking_rate=1.2,
-        effects_profile_id=['handset-class-device'])
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice, audio_config=audio_config
-    )
+    """Use the TTS engine to make an mp3 file from text. Clips already in the TTS cache are copied instead."""
+    cache_key = tts_cache_key(text)
+    if tts_cache.copy_to(cache_key, output_file):
+        print(f'Audio content copied from cache to file {output_file}')
+        return
+    audio_content = tts_engine.synthesize(text)
     if os.path.exists(output_file):
         os.remove(output_file)
     with open(output_file, "wb") as out:
         # Write the response to the output file.
-        out.write(response.audio_content)
+        out.write(audio_content)
         print(f'Audio content written to file {output_file}')
+    tts_cache.put_bytes(cache_key, audio_content)
 
 
+@metrics_lib.traced("video.tts")
 def make_mp3s(post_with_comments):
-    """Use tts function to make mp3 for the post and each comment. Return a list of the mp3 filenames."""
+    """
+    Use tts function to make mp3 for the post and each comment. Return a list of the mp3 filenames.
+    All the clips are synthesized concurrently, so this takes about as long as the slowest clip.
+    """
     post_id = post_with_comments.post.post_id
-    mp3s = []
-
     audio_path = os.path.join(os.getcwd(), "audio")
-    post_mp3 = f"{post_id}.mp3"
-    post_path = os.path.join(audio_path, post_mp3)
-    tts(post_with_comments.post.text, post_path)
-    mp3s.append(post_path)
 
-    comments = post_with_comments.comments
-    for comment in comments:
-        text = comment.text
-        text = preprocess_text(text)
+    post_mp3 = f"{post_id}.mp3"
+    clips = [(post_with_comments.post.text, os.path.join(audio_path, post_mp3))]
+    for comment in post_with_comments.comments:
+        text = preprocess_text(comment.text)
         comment_mp3 = f"{post_id}_{comment.comment_id}.mp3"
-        comment_path = os.path.join(audio_path, comment_mp3)
-        tts(text, comment_path)
-        mp3s.append(comment_path)
-    return mp3s
+        clips.append((text, os.path.join(audio_path, comment_mp3)))
+
+    with ThreadPoolExecutor(max_workers=tts_workers) as executor:
+        futures = [executor.submit(tts, text, path) for text, path in clips]
+        for future in futures:
+            future.result()
+    print(f"TTS cache: {tts_cache.hits} hits, {tts_cache.misses} misses")
+    return [path for _, path in clips]
 
 
 def get_all_image_paths(post_with_comments: PostWithComments):
@@ -116,68 +139,146 @@ def get_all_image_paths(post_with_comments: PostWithComments):
     return png_paths
 
 
-def create_video(image_paths, audio_paths, padding_time: float = 1.0) -> CompositeVideoClip:
-    """
-    Given a list of image paths and a list of audio paths, create a video using
-    moviepy.editor. Each image will be displayed for the duration of the
-    corresponding audio clip, with padding between each clip (during which the image is still visible).
-    """
-    clips = []
-    for i, (image_path, audio_path) in enumerate(zip(image_paths, audio_paths)):
-        # Load image and audio clips
-        image_clip = ImageClip(image_path)
-        audio_clip = AudioFileClip(audio_path)
+def get_all_images(post_with_comments: PostWithComments):
+    """Return the in memory images for the post and comments, falling back to their paths if they were only saved."""
+    return [meta.image if meta.image is not None else meta.path_to_image
+            for meta in [post_with_comments.post] + post_with_comments.comments]
+
+
+def decode_image(image):
+    """Decode a captured image, PNG bytes or a path, to a BGR array. Arrays are returned as they are."""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, bytes):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(image)
 
-        # Set the duration of the image clip to the duration of the audio clip
-        image_clip = image_clip.set_duration(audio_clip.duration)
 
-        audio_clip = audio_fadeout.audio_fadeout(audio_clip, 0.1)
+def get_all_image_top_trims(post_with_comments: PostWithComments):
+    """Return how many rows to trim off the top of each image from get_all_image_paths."""
+    return [0] + [comment.image_top_trim for comment in post_with_comments.comments]
 
-        # Combine the image and audio clips
-        clip = image_clip.set_audio(audio_clip)
 
-        # Add the clip to the list
-        clips.append(clip)
+def create_video(frames, durations, audio_clip) -> CompositeVideoClip:
+    """
+    Given a list of BGR frames, how long to show each one and the voiceover, create a video using
+    moviepy.editor. Each frame will be displayed for the duration of its voiceover segment.
+    """
+    clips = [ImageClip(frame[:, :, ::-1]).set_duration(duration) for frame, duration in zip(frames, durations)]
 
     # Combine all clips into a single video
     video = concatenate_videoclips(clips)
 
-    return video
+    return video.set_audio(audio_clip)
 
 
-def add_music(video_path, music_dir):
+def add_music(video_clip, music_dir):
     """
     Add random lofi backing track to video. Normalize audio so it isn't overpowering.
 
-    :param video_path: path of original video
-    :return:
+    :param video_clip: clip with the voiceover as its audio
+    :return: the clip with the voiceover and music mixed together, ready to be written once
+    """
+    return video_clip.set_audio(add_music_to_audio(video_clip.audio, music_dir))
+
+
+@metrics_lib.traced("video.music")
+def add_music_to_audio(voiceover_clip, music_dir):
+    """
+    Mix a random lofi backing track under the voiceover. Normalize audio so it isn't overpowering.
+
+    :param voiceover_clip: audio clip of the whole voiceover
+    :return: CompositeAudioClip of the voiceover and music
     """
     print("Adding music...")
-    audio_options = [f for f in os.listdir(music_dir) if f.endswith(".mp3")]
-    mp3_file = random.choice(audio_options)
-    video_clip = VideoFileClip(video_path)
-    audio_clip = AudioFileClip(os.path.join(music_dir, mp3_file))
-    normalized_audio_clip = audio_normalize.audio_normalize(audio_clip)
-    normalized_audio_clip = volumex.volumex(normalized_audio_clip, 0.05)
-    video_duration = video_clip.duration
-    min_start_time = 30.0  # first 30 seconds are build up in most music
-    max_start_time = normalized_audio_clip.duration - video_duration
-    start_time = random.uniform(min_start_time, max_start_time)
+    video_duration = voiceover_clip.duration
+    mp3_file, start_time, gain = music_lib.choose_segment(music_dir, video_duration)
     end_time = start_time + video_duration
     print(f"Chose {mp3_file} from {start_time} - {end_time}")
-    audio_segment = normalized_audio_clip.subclip(start_time, end_time)
+    # the gain from the music index normalizes the track, and subclip only decodes from start_time onwards
+    audio_segment = AudioFileClip(os.path.join(music_dir, mp3_file)).subclip(start_time, end_time)
+    audio_segment = volumex.volumex(audio_segment, 0.05 * gain)
     audio_segment = audio_fadein.audio_fadein(audio_segment, 1)
     audio_segment = audio_fadeout.audio_fadeout(audio_segment, 1)
 
-    final_audio_clip = CompositeAudioClip([video_clip.audio, audio_segment])
-    final_clip = video_clip.set_audio(final_audio_clip)
+    return CompositeAudioClip([voiceover_clip, audio_segment])
+
 
-    new_file_name = video_path.replace(".mp4", "_with_music.mp4")
-    if os.path.exists(new_file_name):
-        os.remove(new_file_name)
-    final_clip.write_videofile(new_file_name, codec="libx264", audio_codec="aac", fps=30)
-    print("Done adding music!")
-    return new_file_name
+def decode_audio(audio_path, sample_rate):
+    """Decode an audio file to a float32 stereo PCM array with values in [-1, 1]."""
+    segment = AudioSegment.from_file(audio_path).set_frame_rate(sample_rate).set_channels(2)
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, 2)
+    return samples / float(1 << (8 * segment.sample_width - 1))
+
+
+@metrics_lib.traced("video.voiceover")
+def assemble_voiceover(audio_paths, padding=0.7, fadeout=0.1, sample_rate=44100):
+    """
+    Decode every TTS clip once, fade out the end of each, pad it with silence and join them into one track in memory.
+    Returns the voiceover audio clip and the duration of each (padded) segment.
+    """
+    with ThreadPoolExecutor(max_workers=tts_workers) as executor:
+        decoded = list(executor.map(lambda path: decode_audio(path, sample_rate), audio_paths))
+
+    silence = np.zeros((int(padding * sample_rate), 2), dtype=np.float32)
+    fade_length = int(fadeout * sample_rate)
+    pieces = []
+    durations = []
+    for samples in decoded:
+        n = min(len(samples), fade_length)
+        samples[len(samples) - n:] *= np.linspace(1.0, 0.0, n, dtype=np.float32)[:, None]
+        pieces.extend([samples, silence])
+        durations.append((len(samples) + len(silence)) / sample_rate)
+    voiceover = np.concatenate(pieces)
+    # set_duration also sets the clip's end, which CompositeAudioClip needs to work out its own duration
+    return AudioArrayClip(voiceover, fps=sample_rate).set_duration(len(voiceover) / sample_rate), durations
+
+
+def _pipe_frames(command, *frames):
+    """Run ffmpeg with raw frames on stdin, handing it each frame buffer in turn without copying it."""
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        for buffer in frames:
+            process.stdin.write(memoryview(np.ascontiguousarray(buffer)))
+    finally:
+        process.stdin.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def _raw_frames_input(frames, framerate):
+    height, width = frames.shape[-3:-1]
+    return ["-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-framerate", str(framerate), "-i", "-"]
+
+
+@metrics_lib.traced("video.encode")
+def write_still_video(frames, durations, audio_clip, video_path, fps=30):
+    """
+    Write a slideshow where each frame is held for its duration, without compositing frames in Python.
+    ffmpeg gets each frame once over a pipe, timestamped at the start of its segment, duplicates frames inside the
+    encoder to reach fps and muxes in the audio, which is encoded once to aac beforehand.
+    """
+    audio_path = video_path[:-4] + "_audio.m4a"
+    audio_clip.write_audiofile(audio_path, fps=44100, codec="aac")
+    total = float(np.sum(durations))
+    # the last frame is sent a second time, timestamped at the end of the voiceover. The fps filter only fills in
+    # frames up to the last timestamp it sees, so without it the video would end when the last slide appears
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1], [total]])
+    pts = "+".join(f"eq(N,{index})*{start:.6f}" for index, start in enumerate(starts))
+    # the raw input comes in at 1 fps, so its time base is 1/1 and setpts would round the starts to whole seconds.
+    # settb switches to microseconds first
+    video_filter = f"settb=AVTB,setpts='({pts})/TB',fps={fps},format=yuv420p"
+    command = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+               *_raw_frames_input(frames, 1),
+               "-i", audio_path,
+               "-vf", video_filter,
+               "-c:v", "libx264", "-tune", "stillimage",
+               "-c:a", "copy", "-t", f"{total:.6f}", "-movflags", "+faststart",
+               video_path]
+    try:
+        _pipe_frames(command, frames, frames[-1])
+    finally:
+        os.remove(audio_path)
 
 
 def resize_maintain_aspect_ratio(image, width):
@@ -198,78 +299,159 @@ def resize_maintain_aspect_ratio(image, width):
     return resized
 
 
-def add_background_to_images(image_paths, background_path):
+@functools.lru_cache(maxsize=4)
+def load_background(background_path):
+    """Decode a background image once per process. The array is read only, composite onto copies of it."""
+    background = cv2.imread(background_path)
+    background.setflags(write=False)
+    return background
+
+
+def default_top_trims(n):
+    """Trims for a post followed by comments captured from single comment thread pages."""
+    return [0] + [75] * (n - 1)
+
+
+@metrics_lib.traced("video.composite")
+def composite_images(images, background_path, top_trims=None):
     """
-    Given a list of image paths and a background image path, add each image to the background image and save the result.
+    Centre each image (BGR array) over the background. All the frames are allocated in one block and the
+    background is decoded once per process.
     - Also trims the top of the comment images to hide the "single comment thread" text
-    - Also deletes the original image_paths paths
 
-    :param image_paths: list of paths to images
+    :param images: list of BGR image arrays
     :param background_path: path of background image, should be 1080w x1920h
-    :return: paths to the new images on backgrounds
+    :param top_trims: rows to trim off the top of each image, defaults to 75 for every image but the first
+    :return: array of composited frames, shape (len(images), 1920, 1080, 3)
     """
-    print("Adding images to background...")
-    bg_paths = []
-    for index, image_path in enumerate(image_paths):
-        img = cv2.imread(image_path)
+    if top_trims is None:
+        top_trims = default_top_trims(len(images))
+    background = load_background(background_path)
+    frames = np.empty((len(images),) + background.shape, dtype=background.dtype)
+    frames[:] = background
+    bg_h, bg_w = background.shape[:2]
+    for frame, img, top_trim in zip(frames, images, top_trims):
         img = resize_maintain_aspect_ratio(img, 750)
-        if index != 0:
-            # trim the top to hide the "single comment thread"
-            img = img[75:, :, :]
-        bg = cv2.imread(background_path)
+        # trim the top to hide the "single comment thread"
+        img = img[top_trim:, :, :]
         # center the image over the background, which is 1080 wide and 1920 tall
-        x_offset = 1080 // 2 - img.shape[1] // 2
-        y_offset = 1920 // 2 - img.shape[0] // 2
-        bg[y_offset:y_offset + img.shape[0], x_offset:x_offset + img.shape[1]] = img
-        # get original path and append _bg to the end
-        bg_path = image_path[:-4] + "_bg.png"
-        cv2.imwrite(bg_path, bg)
-        bg_paths.append(bg_path)
-    for path in image_paths:
-        os.remove(path)
-    return bg_paths
-
-
-def add_silence_to_mp3s(mp3_paths):
-    return_list = []
-    for mp3_path in mp3_paths:
-        audio_file = AudioSegment.from_file(mp3_path, format="mp3")
-
-        # Add 1 second of silence to the end of the audio file
-        silence = AudioSegment.silent(duration=700)  # 1000ms = 1s
-        audio_file = audio_file + silence
-
-        export_path = mp3_path[:-4] + "_with_silence.mp3"
-        # Export the new audio file with the added silence
-        audio_file.export(export_path, format="mp3")
-        return_list.append(export_path)
-    return return_list
-
-
-def make_video_from_post_with_comments(post_with_comments: PostWithComments):
+        x_offset = bg_w // 2 - img.shape[1] // 2
+        y_offset = bg_h // 2 - img.shape[0] // 2
+        frame[y_offset:y_offset + img.shape[0], x_offset:x_offset + img.shape[1]] = img
+    return frames
+
+
+def _encode_segment(frame, frames, segment_path, fps, threads):
+    # the loop filter repeats the single input frame inside ffmpeg
+    command = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+               *_raw_frames_input(frame, fps),
+               "-vf", f"loop=loop={frames - 1}:size=1:start=0,format=yuv420p",
+               "-frames:v", str(frames),
+               "-c:v", "libx264", "-tune", "stillimage", "-threads", str(threads),
+               segment_path]
+    _pipe_frames(command, frame)
+    return segment_path
+
+
+@metrics_lib.traced("video.encode")
+def write_segmented_video(frames, durations, audio_clip, video_path, fps=30, workers=4):
+    """
+    Encode each frame as its own segment in parallel, then join the segments with a stream copy and mux the audio.
+    Every segment uses the same codec parameters so they can be concatenated without re-encoding.
+    The encoding happens in ffmpeg processes, so the worker threads here only wait on them.
+    """
+    audio_path = video_path[:-4] + "_audio.m4a"
+    concat_path = video_path[:-4] + "_segments.txt"
+    audio_clip.write_audiofile(audio_path, fps=44100, codec="aac")
+
+    # cut on frame boundaries of the running total, so rounding doesn't drift the slides away from the voiceover
+    boundaries = [0]
+    elapsed = 0.0
+    for duration in durations:
+        elapsed += duration
+        boundaries.append(round(elapsed * fps))
+    segment_paths = [f"{video_path[:-4]}_segment{index}.mp4" for index in range(len(frames))]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_encode_segment, frame, max(1, boundaries[i + 1] - boundaries[i]),
+                                       segment_paths[i], fps, threads)
+                       for i, frame in enumerate(frames)]
+            for future in futures:
+                future.result()
+        with open(concat_path, "w") as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{segment_path}'\n")
+        command = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+                   "-f", "concat", "-safe", "0", "-i", concat_path,
+                   "-i", audio_path,
+                   "-map", "0:v", "-map", "1:a", "-c", "copy", "-shortest", "-movflags", "+faststart",
+                   video_path]
+        subprocess.run(command, check=True)
+    finally:
+        for path in segment_paths + [audio_path, concat_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# "still" feeds each slide to ffmpeg once, "segments" encodes the slides in parallel and stitches them together,
+# "moviepy" composites every frame with create_video
+render_mode = os.environ.get("render_mode", "still")
+render_workers = int(os.environ.get("render_workers", os.cpu_count() or 1))
+
+
+def _no_progress(text):
+    pass
+
+
+@metrics_lib.traced("video")
+def make_video_from_post_with_comments(post_with_comments: PostWithComments, progress=_no_progress,
+                                       audio_paths=None):
+    """
+    Make the video for a curated post, returns the path to it.
+    progress is called with a short description as each stage starts, e.g. to update a Discord message.
+    audio_paths are the clips from make_mp3s if they were already synthesized, otherwise they're made here.
+    """
     if isinstance(post_with_comments, asyncio.Future):
         post_with_comments = post_with_comments.result()
     if post_with_comments is None:
         return
     print(f"3. Making video for post {post_with_comments.post.post_id}...")
 
-    audio_paths = make_mp3s(post_with_comments)
-    audio_paths = add_silence_to_mp3s(audio_paths)
+    if audio_paths is None:
+        progress("synthesizing voiceover")
+        audio_paths = make_mp3s(post_with_comments)
+    voiceover_clip, durations = assemble_voiceover(audio_paths)
 
-    image_paths = get_all_image_paths(post_with_comments)
-    print(image_paths)
-    image_w_bg_paths = add_background_to_images(image_paths, "background.png")
-    video_clip = create_video(image_w_bg_paths, audio_paths)
+    progress("adding images to background")
+    print("Adding images to background...")
+    images = [decode_image(image) for image in get_all_images(post_with_comments)]
+    frames = composite_images(images, "background.png", get_all_image_top_trims(post_with_comments))
+    if persist_images:
+        # only for debugging, the renderers take the frames straight from memory
+        for image_path, frame in zip(get_all_image_paths(post_with_comments), frames):
+            if image_path is not None:
+                cv2.imwrite(image_path[:-4] + "_bg.png", frame)
 
+    music_dir = os.path.join(os.getcwd(), "music")
     video_path = os.path.join(os.getcwd(), "videos", f"{post_with_comments.post.post_id}.mp4")
     if os.path.exists(video_path):
         os.remove(video_path)
-    video_clip.write_videofile(video_path, codec="libx264", audio_codec="aac", fps=30)
+    progress("encoding")
+    if render_mode in ("still", "segments"):
+        audio_clip = add_music_to_audio(voiceover_clip, music_dir)
+        if render_mode == "segments":
+            write_segmented_video(frames, durations, audio_clip, video_path, workers=render_workers)
+        else:
+            write_still_video(frames, durations, audio_clip, video_path)
+    else:
+        video_clip = create_video(frames, durations, voiceover_clip)
+        # mix the music in before writing so the video is only encoded once
+        video_clip = add_music(video_clip, music_dir)
+        with metrics_lib.span("video.encode", post_id=post_with_comments.post.post_id):
+            video_clip.write_videofile(video_path, codec="libx264", audio_codec="aac", fps=30)
     print(f"Done making video for {post_with_comments.post.post_id}, output to {video_path}")
-
-    music_dir = os.path.join(os.getcwd(), "music")
-    final_video_path = add_music(video_path, music_dir)
-    return final_video_path
+    return video_path
 
 
 def make_and_post_video(post_with_comments: PostWithComments):
@@ -280,11 +462,18 @@ def make_and_post_video(post_with_comments: PostWithComments):
     :return: path to video if succeeded, or None otherwise
     """
     final_video_path = make_video_from_post_with_comments(post_with_comments)
+    post_video(post_with_comments, final_video_path)
+
 
+@metrics_lib.traced("video.upload")
+def post_video(post_with_comments: PostWithComments, video_path):
+    """Upload a finished video to the channel for its subreddit."""
     if post_with_comments.subreddit.lower() == "askreddit":
         try:
             print("Posting to youtube...")
-            youtube_lib.upload_to_askreddit_channel(final_video_path, post_with_comments.post.text)
+            video_link = youtube_lib.upload_to_askreddit_channel(video_path, post_with_comments.post.text)
+            if video_link is not None:  # None on a dry run
+                produced_posts.add(post_with_comments.post.post_id, post_with_comments.post.text)
         except Exception as e:
             print(f"Error uploading to youtube: {e}")
 
@@ -1,11 +1,13 @@
 from simple_youtube_api.Channel import Channel
 from simple_youtube_api.LocalVideo import LocalVideo
 import os
+import metrics_lib
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+@metrics_lib.traced("youtube.upload")
 def upload_to_askreddit_channel(video_path, title, unlisted=True):
     title = f"AskReddit: {title} #askreddit #reddit #shorts"
     print("Proposed title: ", title)
@@ -33,5 +35,5 @@ def upload_to_askreddit_channel(video_path, title, unlisted=True):
 
 
 if __name__ == '__main__':
-    video_link = upload_to_askreddit_channel("videos/133em4v_with_music.mp4",
+    video_link = upload_to_askreddit_channel("videos/133em4v.mp4",
                                              "What wouldn't you buy even if you were rich?")